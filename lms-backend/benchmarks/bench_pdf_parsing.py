@@ -0,0 +1,72 @@
+"""
+Compare PDF parsing throughput of PyPDFLoader against the page-parallel loader.
+
+    python -m benchmarks.bench_pdf_parsing                 # synthetic 300-page PDF
+    python -m benchmarks.bench_pdf_parsing lecture.pdf     # your own files
+    python -m benchmarks.bench_pdf_parsing --pages 1000 --workers 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+from langchain_community.document_loaders import PyPDFLoader
+from reportlab.lib.pagesizes import LETTER
+from reportlab.pdfgen import canvas
+from utils.pdf_parsing import load_pdf_parallel
+
+def make_synthetic_pdf(path: str, pages: int):
+    c = canvas.Canvas(path, pagesize=LETTER)
+    width, height = LETTER
+    for page in range(pages):
+        y = height - 50
+        for line in range(45):
+            c.drawString(50, y, f"Lecture page {page + 1}, line {line + 1}: gradient descent, regularization and backpropagation.")
+            y -= 14
+        c.showPage()
+    c.save()
+
+def time_it(fn, repeats: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="PDF files to parse (default: a generated PDF)")
+    parser.add_argument("--pages", type=int, default=300, help="pages in the generated PDF")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    files = args.files
+    temp_dir = None
+    if not files:
+        temp_dir = tempfile.mkdtemp()
+        synthetic = os.path.join(temp_dir, "synthetic.pdf")
+        make_synthetic_pdf(synthetic, args.pages)
+        files = [synthetic]
+
+    for path in files:
+        baseline_seconds, baseline = time_it(lambda: PyPDFLoader(path).load(), args.repeats)
+        pages = len(baseline)
+        print(f"{os.path.basename(path)}: {pages} pages")
+        print(f"  PyPDFLoader           {baseline_seconds:7.2f}s  {pages / baseline_seconds:8.1f} pages/s")
+
+        for workers in args.workers:
+            # First call pays process start-up; report the warm pool like a long-running server would
+            load_pdf_parallel(path, workers=workers)
+            seconds, documents = time_it(lambda: load_pdf_parallel(path, workers=workers), args.repeats)
+            same_text = [d.page_content for d in documents] == [d.page_content for d in baseline]
+            print(f"  parallel ({workers} workers) {seconds:7.2f}s  {pages / seconds:8.1f} pages/s  "
+                  f"speedup {baseline_seconds / seconds:4.1f}x  same text: {same_text}")
+
+    if temp_dir:
+        os.remove(files[0])
+        os.rmdir(temp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Compare float32, int8 and binary local vector indexes on a synthetic corpus:
+memory held, search latency and recall@10 against exact float32.
+
+Quantization is an in-memory option of the local index only: chunks_embed keeps just the float
+embedding column (for the RPCs and for rescoring), so storage per chunk is unchanged.
+
+    python -m benchmarks.bench_quantization
+    python -m benchmarks.bench_quantization --chunks 200000 --queries 200 --multiplier 3 10
+
+Quantized searches rescore their shortlist with float vectors served from memory here, so the
+latencies exclude the chunks_embed round trip a live index pays for that shortlist.
+"""
+import argparse
+import time
+import numpy as np
+from database.vector_index import CourseVectorIndex, _normalize
+
+def make_corpus(chunks: int, dim: int, topics: int, seed: int) -> np.ndarray:
+    """Unit vectors scattered around topic centres, closer to sentence embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, topics, chunks)] + 0.8 * rng.standard_normal((chunks, dim)).astype(np.float32)
+    return _normalize(vectors)
+
+def make_queries(corpus: np.ndarray, queries: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    picked = corpus[rng.integers(0, len(corpus), queries)]
+    # Noise of norm ~0.5: queries land near, not on, corpus chunks
+    noise = rng.standard_normal(picked.shape).astype(np.float32) / np.sqrt(corpus.shape[1])
+    return _normalize(picked + 0.5 * noise)
+
+def build_index(corpus: np.ndarray, quantization, multiplier) -> CourseVectorIndex:
+    positions = {}
+    index = CourseVectorIndex(
+        0,
+        dim=corpus.shape[1],
+        quantization=quantization,
+        vector_source=lambda chunk_ids: {chunk_id: corpus[positions[chunk_id]] for chunk_id in chunk_ids},
+        rescore_multiplier=multiplier
+    )
+    ids = list(range(1, len(corpus) + 1))
+    positions.update({chunk_id: i for i, chunk_id in enumerate(ids)})
+    index.add(ids, [1] * len(ids), [""] * len(ids), corpus)
+    return index
+
+def run(index: CourseVectorIndex, queries: np.ndarray, k: int):
+    start = time.perf_counter()
+    results = [[r[0] for r in index.search(query, limit_rows=k)] for query in queries]
+    return (time.perf_counter() - start) / len(queries), results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--multiplier", type=int, nargs="+", default=None,
+                        help="rescore multipliers to try (default: the index defaults)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.chunks, args.dim, args.topics, args.seed)
+    queries = make_queries(corpus, args.queries, args.seed)
+    print(f"{args.chunks} chunks x {args.dim} dims, {args.queries} queries, recall@{args.k} vs exact float32")
+
+    baseline = build_index(corpus, None, None)
+    baseline_seconds, truth = run(baseline, queries, args.k)
+    print(f"  {'float32':<18} memory {baseline.nbytes() / 2**20:8.1f} MiB  "
+          f"latency {baseline_seconds * 1000:7.2f} ms  recall 1.000")
+
+    for quantization in ("int8", "binary"):
+        for multiplier in args.multiplier or [None]:
+            index = build_index(corpus, quantization, multiplier)
+            run(index, queries[:5], args.k)
+            seconds, results = run(index, queries, args.k)
+            recall = np.mean([len(set(found) & set(expected)) / args.k for found, expected in zip(results, truth)])
+            label = f"{quantization} (x{index.rescore_multiplier})"
+            print(f"  {label:<18} memory {index.nbytes() / 2**20:8.1f} MiB  "
+                  f"latency {seconds * 1000:7.2f} ms  recall {recall:.3f}  "
+                  f"(memory {baseline.nbytes() / index.nbytes():.1f}x smaller, "
+                  f"{baseline_seconds / seconds:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
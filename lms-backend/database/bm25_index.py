@@ -0,0 +1,175 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from collections import Counter
+import math
+import re
+import threading
+
+# English stop words plus request phrasing ("I want ...", "please ...") that shows up in prompts
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have having
+he her here hers herself him himself his how i if in into is it its itself just me more most my myself no
+nor not of off on once only or other our ours ourselves out over own same she should so some such than
+that the their theirs them themselves then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your yours yourself yourselves
+want wants need please
+dont doesnt didnt isnt arent wasnt werent cant couldnt wont wouldnt shouldnt whats thats theres
+hows im ive id youre youve theyre weve lets
+""".split())
+
+# Apostrophes inside a word are dropped ("don't" -> "dont") rather than splitting off one-letter tokens
+_APOSTROPHE_RE = re.compile(r"(?<=\w)['\u2019\u02bc](?=\w)")
+# Unicode words, with hyphenated compounds ("k-means") kept together
+_TOKEN_RE = re.compile(r"\w+(?:-\w+)*")
+# Shorter prefix terms ("c:*", "k:*") match most of the corpus
+MIN_PREFIX_LENGTH = 3
+
+def _measure(stem: str) -> int:
+    """Porter's m: the number of vowel-consonant sequences in a stem"""
+    form = "".join("v" if ch in "aeiou" or (ch == "y" and i > 0 and stem[i - 1] not in "aeiou") else "c"
+                   for i, ch in enumerate(stem))
+    return form.count("vc")
+
+def stem(word: str) -> str:
+    """
+    Light suffix-stripping stemmer (Porter step 1 plus the most common derivational suffixes).
+    Good enough to conflate plurals and verb forms like networks/network and training/trained/train.
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+    # Step 1a: plurals
+    if word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith("ies"):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith("ss") and not word.endswith("us") and not word.endswith("is"):
+        word = word[:-1]
+    # Step 1b: -eed, -ed, -ing
+    if word.endswith("eed"):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+    else:
+        for suffix in ("ing", "ed"):
+            base = word[:-len(suffix)]
+            if word.endswith(suffix) and any(ch in "aeiouy" for ch in base):
+                word = base
+                if word.endswith(("at", "bl", "iz")):
+                    word += "e"
+                elif len(word) > 2 and word[-1] == word[-2] and word[-1] not in "lsz":
+                    word = word[:-1]
+                break
+    # Step 1c: y -> i
+    if word.endswith("y") and any(ch in "aeiou" for ch in word[:-1]):
+        word = word[:-1] + "i"
+    # Common derivational suffixes, only on stems long enough to keep their meaning
+    for suffix, replacement in (("ational", "ate"), ("ization", "ize"), ("fulness", "ful"), ("iveness", "ive"),
+                                ("ousness", "ous"), ("ation", "ate"), ("ement", ""), ("ment", ""), ("ness", ""),
+                                ("ance", ""), ("ence", ""), ("able", ""), ("ible", ""), ("ical", "ic"), ("ally", "al")):
+        if word.endswith(suffix) and _measure(word[:-len(suffix)]) > 1:
+            return word[:-len(suffix)] + replacement
+    if word.endswith("e") and _measure(word[:-1]) > 1:
+        word = word[:-1]
+    return word
+
+def _words(text: str) -> Iterable[str]:
+    """Hyphenated compounds yield the joined word and its parts, like Postgres' parser"""
+    for word in _TOKEN_RE.findall(_APOSTROPHE_RE.sub("", text.lower())):
+        if "-" in word:
+            parts = word.split("-")
+            yield "".join(parts)
+            yield from parts
+        else:
+            yield word
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split into words, drop stop words and stem"""
+    return [stem(token) for token in _words(text) if token not in STOP_WORDS]
+
+def to_ts_query(query_text: str) -> str:
+    """
+    tsquery for the hybrid-search RPCs, e.g. 'gradient:* | descent:*'.
+    Uses the same stop words and stems as the local index, so common words no longer
+    expand into huge prefix posting lists server-side. Terms shorter than MIN_PREFIX_LENGTH
+    are left out for the same reason.
+    """
+    terms = [term for term in dict.fromkeys(tokenize(query_text)) if len(term) >= MIN_PREFIX_LENGTH]
+    return ' | '.join(f'{term}:*' for term in terms) if terms else '*:*'
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked id lists: score(id) = sum over lists of 1 / (k + rank). Best first."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+class BM25Index:
+    """Okapi BM25 over chunk texts, updated in place as chunks are added or their documents removed"""
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.RLock()
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.chunk_doc: Dict[int, int] = {}
+        self.chunk_terms: Dict[int, List[str]] = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, ids: Iterable[int], doc_ids: Iterable[int], contents: Iterable[str]):
+        with self.lock:
+            for chunk_id, doc_id, content in zip(ids, doc_ids, contents):
+                if chunk_id in self.lengths:
+                    self._remove_chunk(chunk_id)
+                terms = tokenize(content)
+                counts = Counter(terms)
+                for term, count in counts.items():
+                    self.postings.setdefault(term, {})[chunk_id] = count
+                self.chunk_terms[chunk_id] = list(counts)
+                self.lengths[chunk_id] = len(terms)
+                self.chunk_doc[chunk_id] = doc_id
+                self.total_length += len(terms)
+
+    def remove(self, chunk_ids: Iterable[int]):
+        with self.lock:
+            for chunk_id in chunk_ids:
+                if chunk_id in self.lengths:
+                    self._remove_chunk(chunk_id)
+
+    def remove_documents(self, doc_ids: Iterable[int]):
+        removed = set(doc_ids)
+        with self.lock:
+            for chunk_id in [c for c, d in self.chunk_doc.items() if d in removed]:
+                self._remove_chunk(chunk_id)
+
+    def _remove_chunk(self, chunk_id: int):
+        for term in self.chunk_terms.pop(chunk_id):
+            postings = self.postings[term]
+            del postings[chunk_id]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(chunk_id)
+        del self.chunk_doc[chunk_id]
+
+    def search(self, query_text: str, relevant_doc_ids: Optional[Iterable[int]] = None, limit_rows: int = 10) -> List[Tuple[int, float]]:
+        """Return (chunk id, BM25 score) pairs, best first"""
+        allowed = set(relevant_doc_ids) if relevant_doc_ids is not None else None
+        with self.lock:
+            n = len(self.lengths)
+            if not n:
+                return []
+            average_length = self.total_length / n
+            scores: Dict[int, float] = {}
+            for term in set(tokenize(query_text)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    if allowed is not None and self.chunk_doc[chunk_id] not in allowed:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit_rows]
@@ -0,0 +1,102 @@
+from typing import Dict, Iterable, List, Tuple
+import os
+import threading
+import time
+from .supabase_db import get_supabase_client
+
+class DocumentIdCache:
+    """
+    In-memory file path -> document ids map in front of document_embed.
+    Paths are resolved in one query per batch of misses; StorageManager invalidates a
+    path whenever it writes a document for it, and entries also expire after ttl_seconds
+    so that ingests made by other worker processes are picked up. Paths with no document
+    yet expire after empty_ttl_seconds instead, since their ingest may still be running.
+    warm_course skips the query while the course's previous warm-up is younger than ttl_seconds.
+    """
+    def __init__(self, ttl_seconds: float = 600.0, empty_ttl_seconds: float = 5.0, lookup_batch_size: int = 100):
+        self.ttl_seconds = ttl_seconds
+        self.empty_ttl_seconds = empty_ttl_seconds
+        self.lookup_batch_size = lookup_batch_size
+        self.entries: Dict[str, Tuple[float, List[int]]] = {}
+        self.warmed_courses: Dict[int, Tuple[float, int]] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, paths: Iterable[str]) -> Dict[str, List[int]]:
+        """Map each path to its document ids ([] if nothing has been ingested for it)"""
+        paths = list(dict.fromkeys(paths))
+        now = time.monotonic()
+        resolved, missing = {}, []
+        with self.lock:
+            for path in paths:
+                entry = self.entries.get(path)
+                if entry is not None and entry[0] > now:
+                    resolved[path] = entry[1]
+                else:
+                    missing.append(path)
+            self.hits += len(resolved)
+            self.misses += len(missing)
+
+        if missing:
+            found: Dict[str, List[int]] = {path: [] for path in missing}
+            for start in range(0, len(missing), self.lookup_batch_size):
+                response = get_supabase_client().table('document_embed')\
+                    .select('id, file_path')\
+                    .in_('file_path', missing[start:start + self.lookup_batch_size])\
+                    .execute()
+                for row in response.data:
+                    found[row['file_path']].append(row['id'])
+            self._store(found)
+            resolved.update(found)
+        return {path: resolved[path] for path in paths}
+
+    def warm_course(self, course_id: int) -> int:
+        """Load every path of a course in one query; returns the number of paths cached"""
+        with self.lock:
+            warmed = self.warmed_courses.get(course_id)
+            if warmed is not None and warmed[0] > time.monotonic():
+                return warmed[1]
+        response = get_supabase_client().table('document_embed')\
+            .select('id, file_path')\
+            .eq('course_id', course_id)\
+            .execute()
+        found: Dict[str, List[int]] = {}
+        for row in response.data:
+            found.setdefault(row['file_path'], []).append(row['id'])
+        self._store(found)
+        with self.lock:
+            self.warmed_courses[course_id] = (time.monotonic() + self.ttl_seconds, len(found))
+        return len(found)
+
+    def _store(self, found: Dict[str, List[int]]):
+        now = time.monotonic()
+        with self.lock:
+            for path, doc_ids in found.items():
+                if doc_ids:
+                    self.entries[path] = (now + self.ttl_seconds, sorted(doc_ids))
+                elif self.empty_ttl_seconds > 0:
+                    self.entries[path] = (now + self.empty_ttl_seconds, [])
+                else:
+                    self.entries.pop(path, None)
+
+    def invalidate_paths(self, paths: Iterable[str]):
+        with self.lock:
+            for path in paths:
+                self.entries.pop(path, None)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "warmed_courses": len(self.warmed_courses),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+document_ids = DocumentIdCache(
+    ttl_seconds=float(os.getenv("DOCUMENT_ID_CACHE_TTL", "600")),
+    empty_ttl_seconds=float(os.getenv("DOCUMENT_ID_CACHE_EMPTY_TTL", "5"))
+)
@@ -0,0 +1,142 @@
+from typing import Any, Callable, Dict, List, Optional
+import bisect
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class _Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self) -> Dict:
+        labels = [f"le_{bound}" for bound in self.bounds] + ["inf"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0
+        }
+
+# Body size of the last PostgREST response received on each thread, set by record_response_size
+_response_sizes = threading.local()
+
+def record_response_size(response):
+    """httpx response hook: remember the Content-Length of the response for the call being timed on this thread"""
+    length = response.headers.get('content-length')
+    _response_sizes.last = int(length) if length is not None else None
+
+def install_response_hook(client):
+    """Register record_response_size on a Supabase client's PostgREST session (once)"""
+    hooks = client.postgrest.session.event_hooks['response']
+    if record_response_size not in hooks:
+        hooks.append(record_response_size)
+
+class RetrievalMetrics:
+    """
+    Counters and latency histograms for retrieval calls, in place of printing whole responses.
+    Payload sizes come from the responses' Content-Length (see install_response_hook), so
+    recording a call costs no serialization; responses sent without one count as unsized_calls.
+    Hooks registered with add_hook receive one event dict per call, e.g. to forward to a
+    metrics backend. With RETRIEVER_DEBUG_SAMPLE_RATE > 0 that fraction of calls also logs
+    its full payload at DEBUG level.
+    """
+    def __init__(self, debug_sample_rate: float = 0.0):
+        self.debug_sample_rate = debug_sample_rate
+        self.lock = threading.Lock()
+        self.hooks: List[Callable[[Dict], None]] = []
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls: Dict[str, Dict[str, Any]] = {}
+            self.hybrid_searches = 0
+            self.hybrid_fallbacks = 0
+            self.stage_skips: Dict[str, int] = {}
+
+    def add_hook(self, hook: Callable[[Dict], None]):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[Dict], None]):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    @staticmethod
+    def start_call() -> float:
+        """Clear this thread's last response size and return the start time to pass to record_call"""
+        _response_sizes.last = None
+        return time.perf_counter()
+
+    def record_call(self, name: str, started: float, rows: Optional[list], error: Optional[Exception] = None):
+        """Record one RPC/query; `started` comes from start_call() right before the call"""
+        latency_ms = (time.perf_counter() - started) * 1000
+        rows = rows or []
+        payload_bytes = getattr(_response_sizes, 'last', None)
+        sampled = self.debug_sample_rate and random.random() < self.debug_sample_rate
+        if payload_bytes is None and sampled:
+            # Compact JSON length is a close stand-in for an unsized body
+            payload_bytes = len(json.dumps(rows, separators=(',', ':'), default=str))
+        with self.lock:
+            stats = self.calls.setdefault(name, {
+                "latency_ms": _Histogram(), "calls": 0, "errors": 0, "rows": 0, "payload_bytes": 0, "unsized_calls": 0
+            })
+            stats["latency_ms"].observe(latency_ms)
+            stats["calls"] += 1
+            stats["errors"] += error is not None
+            stats["rows"] += len(rows)
+            if payload_bytes is None:
+                stats["unsized_calls"] += 1
+            else:
+                stats["payload_bytes"] += payload_bytes
+
+        event = {"name": name, "latency_ms": latency_ms, "rows": len(rows), "payload_bytes": payload_bytes,
+                 "error": str(error) if error else None}
+        for hook in list(self.hooks):
+            try:
+                hook(event)
+            except Exception as e:
+                logger.warning(f"retrieval metrics hook failed: {e}")
+        if sampled:
+            logger.debug(f"{name} payload ({latency_ms:.1f} ms): {rows}")
+
+    def record_hybrid(self, fell_back: bool):
+        with self.lock:
+            self.hybrid_searches += 1
+            self.hybrid_fallbacks += fell_back
+
+    def record_skip(self, stage: str):
+        """Count a rerank stage that was skipped to stay within its latency budget"""
+        with self.lock:
+            self.stage_skips[stage] = self.stage_skips.get(stage, 0) + 1
+
+    def snapshot(self, cache_stats: Optional[Dict] = None) -> Dict:
+        with self.lock:
+            calls = {
+                name: {**{k: v for k, v in stats.items() if k != "latency_ms"},
+                       "latency_ms": stats["latency_ms"].snapshot()}
+                for name, stats in self.calls.items()
+            }
+            return {
+                "calls": calls,
+                "hybrid_searches": self.hybrid_searches,
+                "hybrid_fallbacks": self.hybrid_fallbacks,
+                "hybrid_fallback_rate": self.hybrid_fallbacks / self.hybrid_searches if self.hybrid_searches else 0.0,
+                "stage_skips": dict(self.stage_skips),
+                "cache": cache_stats or {}
+            }
+
+retrieval_metrics = RetrievalMetrics(debug_sample_rate=float(os.getenv("RETRIEVER_DEBUG_SAMPLE_RATE", "0")))
@@ -1,11 +1,97 @@
-from typing import List, Optional, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import inspect
 import numpy as np
-import re
-from .supabase_db import create_supabase_client
+import os
+import threading
+import time
+from utils.embedding_models import encode_texts, get_cross_encoder
+from .supabase_db import get_supabase_client
+from .bm25_index import to_ts_query
+from .document_id_cache import document_ids
+from .retrieval_metrics import install_response_hook, retrieval_metrics
+from .search_cache import search_cache
+from .vector_index import vector_indexes
+
+# Bounds how many RPCs the async API keeps in flight at once
+RETRIEVER_MAX_CONCURRENCY = int(os.getenv("RETRIEVER_MAX_CONCURRENCY", "8"))
+_rpc_executor = ThreadPoolExecutor(max_workers=RETRIEVER_MAX_CONCURRENCY, thread_name_prefix="retriever")
+
+class _StageTimer:
+    """Exponentially weighted per-candidate cost of a rerank stage, used to predict whether it fits a budget"""
+    def __init__(self, initial_seconds_per_item: float, alpha: float = 0.2):
+        self.seconds_per_item = initial_seconds_per_item
+        self.alpha = alpha
+        self.lock = threading.Lock()
+
+    def estimate(self, items: int) -> float:
+        return self.seconds_per_item * items
+
+    def record(self, items: int, seconds: float):
+        if items:
+            with self.lock:
+                self.seconds_per_item += self.alpha * (seconds / items - self.seconds_per_item)
+
+_cross_encoder_timer = _StageTimer(initial_seconds_per_item=0.005)
+
+def cached_search(kind: str):
+    """
+    Serve a search method from the shared result cache, keyed on
+    (kind, tsquery, embedding digest, sorted doc ids, limit, offset).
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not search_cache.enabled:
+                return method(self, *args, **kwargs)
+            arguments = signature.bind(self, *args, **kwargs)
+            arguments.apply_defaults()
+            params = arguments.arguments
+            query_text = params.get('query_text')
+            relevant_doc_ids = params.get('relevant_doc_ids')
+            key = search_cache.make_key(
+                kind,
+                to_ts_query(query_text) if query_text is not None else None,
+                params['query_embedding'],
+                relevant_doc_ids,
+                params['limit_rows'],
+                params['offset_rows']
+            )
+            results = search_cache.get(key)
+            if results is None:
+                results = method(self, *args, **kwargs)
+                search_cache.put(key, results, relevant_doc_ids)
+            return list(results)
+        return wrapper
+    return decorator
 
 class Retriever:
-    def __init__(self):
-        self.supabase = create_supabase_client()
+    def __init__(self, use_local_index: Optional[bool] = None):
+        # Shared pooled client: constructing a Retriever no longer opens new connections
+        self.supabase = get_supabase_client()
+        try:
+            install_response_hook(self.supabase)
+        except AttributeError as e:
+            print(f"retrieval metrics: response sizes unavailable ({e})")
+        # Serve embedding searches from the in-process per-course index instead of the RPCs
+        if use_local_index is None:
+            use_local_index = os.getenv("RETRIEVER_LOCAL_INDEX", "false").lower() in ("1", "true", "yes")
+        self.use_local_index = use_local_index
+
+    def _rpc(self, name: str, params: Dict) -> List[Dict]:
+        """Call a Postgres function and record its latency, row count and payload size"""
+        started = retrieval_metrics.start_call()
+        try:
+            rows = self.supabase.rpc(name, params).execute().data
+        except Exception as e:
+            retrieval_metrics.record_call(name, started, None, error=e)
+            raise
+        retrieval_metrics.record_call(name, started, rows)
+        return rows
 
     def _convert_embedding_to_list(self, embedding: Union[List[float], np.ndarray]) -> List[float]:
         """Convert embedding to list format if it's a numpy array."""
@@ -13,6 +99,7 @@ class Retriever:
             return embedding.tolist()
         return embedding
 
+    @cached_search('filtered_hybrid')
     def filtered_hybrid_search(
         self,
         query_text: str,
@@ -24,23 +111,19 @@ class Retriever:
         """
         Perform hybrid search (text + embedding) with document filtering.
         Returns list of (id, content, embedding_id, similarity, text_rank) tuples.
+        With the local index enabled, text_rank is a BM25 score and rows are ordered by
+        reciprocal rank fusion of the lexical and dense rankings; documents the local index
+        can't serve yet (e.g. mid-ingest) send the query to the RPC instead.
         """
+        if self.use_local_index:
+            rows = vector_indexes.hybrid_search(query_text, query_embedding, relevant_doc_ids, limit_rows, offset_rows)
+            if rows is not None:
+                return rows
+
         query_embedding = self._convert_embedding_to_list(query_embedding)
 
-        # Preprocess query_text to create tsquery string (e.g., 'term1:* | term2:* | term3:*')
-        stop_words = {'i', 'want', 'to', 'an', 'on', 'the', 'a', 'and', 'or'}
-        words = [word for word in re.sub(r'[^\w\s]', '', query_text).lower().split() if word not in stop_words]
-        ts_query = ' | '.join(f'{word}:*' for word in words) if words else '*:*'
-
-        query = {
-            'query_text': ts_query,
-            'query_embedding': query_embedding,
-            'relevant_doc_ids': relevant_doc_ids,
-            'limit_rows': limit_rows,
-            'offset_rows': offset_rows
-        }
-        # print("Query", query)
-        response = self.supabase.rpc(
+        ts_query = to_ts_query(query_text)
+        rows = self._rpc(
             'filtered_hybrid_search_chunks',
             {
                 'query_text': ts_query,
@@ -49,21 +132,22 @@ class Retriever:
                 'limit_rows': limit_rows,
                 'offset_rows': offset_rows
             }
-        ).execute()
-        print("filtered_hybrid_search resp:", response)
+        )
 
         # Fallback to embedding-only search if no results
-        if not response.data:
-            print("No chunks found. Falling back to embedding-only search.")
+        retrieval_metrics.record_hybrid(fell_back=not rows)
+        if not rows:
             return self.filtered_search(
+                query_text=query_text,
                 query_embedding=query_embedding,
                 relevant_doc_ids=relevant_doc_ids,
                 limit_rows=limit_rows,
                 offset_rows=offset_rows
             )
 
-        return [(r['id'], r['content'], r['embedding_id'], r['similarity'], r['text_rank']) for r in response.data]
+        return [(r['id'], r['content'], r['embedding_id'], r['similarity'], r['text_rank']) for r in rows]
 
+    @cached_search('filtered')
     def filtered_search(
         self,
         query_text: str,
@@ -76,8 +160,13 @@ class Retriever:
         Perform embedding-based search with document filtering.
         Returns list of (id, content, embedding_id, similarity) tuples.
         """
+        if self.use_local_index:
+            rows = vector_indexes.search(query_embedding, relevant_doc_ids, limit_rows, offset_rows)
+            if rows is not None:
+                return rows
+
         query_embedding = self._convert_embedding_to_list(query_embedding)
-        response = self.supabase.rpc(
+        rows = self._rpc(
             'filtered_search_chunks',
             {   'query_text': query_text,
                 'query_embedding': query_embedding,
@@ -85,19 +174,40 @@ class Retriever:
                 'limit_rows': limit_rows,
                 'offset_rows': offset_rows
             }
-        ).execute()
-        print("filtered_search resp:", response)
-        return [(r['id'],r['content'], r['embedding_id'], r['similarity']) for r in response.data]
+        )
+        return [(r['id'],r['content'], r['embedding_id'], r['similarity']) for r in rows]
 
     def get_document_ids_by_urls(self, urls: List[str]) -> List[int]:
-        """Get document IDs for given URLs."""
-        response = self.supabase.rpc(
-            'get_document_ids_by_urls',
-            {'urls': urls}
-        ).execute()
-        print("get_doc_ids_by_urls resp:", response)
-        return response.data
+        """Get document IDs for given URLs (file paths), served from the in-memory id map."""
+        resolved = document_ids.resolve(urls)
+        return list(dict.fromkeys(doc_id for url in urls for doc_id in resolved[url]))
 
+    def iter_document_chunks(self, document_ids: List[int], page_size: int = 100) -> Iterator[Dict]:
+        """
+        Yield every chunk of the given documents in reading order (document by document, by chunk_index).
+        Pages are fetched with keyset pagination on chunk_index, so memory use stays constant
+        however long the document is. Each chunk is a dict with id, embedding_id, chunk_index and content.
+        """
+        for document_id in document_ids:
+            last_index = -1
+            while True:
+                response = self.supabase.table('chunks_embed')\
+                    .select('id, embedding_id, chunk_index, content')\
+                    .eq('embedding_id', document_id)\
+                    .gt('chunk_index', last_index)\
+                    .order('chunk_index')\
+                    .limit(page_size)\
+                    .execute()
+                yield from response.data
+                if len(response.data) < page_size:
+                    break
+                last_index = response.data[-1]['chunk_index']
+
+    def resolve_document_ids(self, urls: List[str]) -> Dict[str, List[int]]:
+        """Batch resolution: map each URL (file path) to its document IDs."""
+        return document_ids.resolve(urls)
+
+    @cached_search('hybrid')
     def hybrid_search(
         self,
         query_text: str,
@@ -111,19 +221,8 @@ class Retriever:
         """
         query_embedding = self._convert_embedding_to_list(query_embedding)
 
-        # Preprocess query_text to create tsquery string (e.g., 'term1:* | term2:* | term3:*')
-        stop_words = {'i', 'want', 'to', 'an', 'on', 'the', 'a', 'and', 'or'}
-        words = [word for word in re.sub(r'[^\w\s]', '', query_text).lower().split() if word not in stop_words]
-        ts_query = ' | '.join(f'{word}:*' for word in words) if words else '*:*'
-
-        query = {
-            'query_text': ts_query,
-            'query_embedding': query_embedding,
-            'limit_rows': limit_rows,
-            'offset_rows': offset_rows
-        }
-        # print("Query", query)
-        response = self.supabase.rpc(
+        ts_query = to_ts_query(query_text)
+        rows = self._rpc(
             'hybrid_search_chunks',
             {
                 'query_text': ts_query,
@@ -131,20 +230,20 @@ class Retriever:
                 'limit_rows': limit_rows,
                 'offset_rows': offset_rows
             }
-        ).execute()
-        print("hybrid_search resp:", response)
+        )
 
         # Fallback to embedding-only search if no results
-        if not response.data:
-            print("No chunks found. Falling back to embedding-only search.")
-            return self.search(
+        retrieval_metrics.record_hybrid(fell_back=not rows)
+        if not rows:
+            return self.search_chunks(
                 query_embedding=query_embedding,
                 limit_rows=limit_rows,
                 offset_rows=offset_rows
             )
 
-        return [(r['id'], r['content'], r['embedding_id'], r['similarity'], r['text_rank']) for r in response.data]
+        return [(r['id'], r['content'], r['embedding_id'], r['similarity'], r['text_rank']) for r in rows]
 
+    @cached_search('chunks')
     def search_chunks(
         self,
         query_embedding: Union[List[float], np.ndarray],
@@ -156,16 +255,120 @@ class Retriever:
         Returns list of (id, content, embedding_id, similarity) tuples.
         """
         query_embedding = self._convert_embedding_to_list(query_embedding)
-        response = self.supabase.rpc(
+        rows = self._rpc(
             'search_chunks',
             {
                 'query_embedding': query_embedding,
                 'limit_rows': limit_rows,
                 'offset_rows': offset_rows
             }
-        ).execute()
-        print("search_chunks resp:", response)
-        return [(r['id'],r['content'], r['embedding_id'], r['similarity']) for r in response.data]
+        )
+        return [(r['id'],r['content'], r['embedding_id'], r['similarity']) for r in rows]
+
+    def batch_search(
+        self,
+        query_texts: List[str],
+        relevant_doc_ids: Optional[List[int]] = None,
+        query_embeddings: Optional[Union[List[List[float]], np.ndarray]] = None,
+        limit_rows: int = 10
+    ) -> Dict[str, List]:
+        """
+        Run one hybrid search per query text concurrently (filtered when relevant_doc_ids is given).
+        Missing query embeddings are encoded in a single batched model call.
+        Returns {"per_query": [results for each query], "merged": deduplicated results, best similarity first}.
+        """
+        if query_embeddings is None:
+            query_embeddings = encode_texts(query_texts)
+        futures = [
+            _rpc_executor.submit(self._search_one, query_text, query_embedding, relevant_doc_ids, limit_rows)
+            for query_text, query_embedding in zip(query_texts, query_embeddings)
+        ]
+        per_query = [future.result() for future in futures]
+        return {"per_query": per_query, "merged": self.merge_results(per_query)}
+
+    async def abatch_search(
+        self,
+        query_texts: List[str],
+        relevant_doc_ids: Optional[List[int]] = None,
+        query_embeddings: Optional[Union[List[List[float]], np.ndarray]] = None,
+        limit_rows: int = 10
+    ) -> Dict[str, List]:
+        """Awaitable batch_search"""
+        if query_embeddings is None:
+            query_embeddings = await asyncio.get_running_loop().run_in_executor(None, encode_texts, query_texts)
+        per_query = await asyncio.gather(*[
+            self._run_async(self._search_one, query_text, query_embedding, relevant_doc_ids, limit_rows)
+            for query_text, query_embedding in zip(query_texts, query_embeddings)
+        ])
+        return {"per_query": list(per_query), "merged": self.merge_results(per_query)}
+
+    def _search_one(self, query_text: str, query_embedding, relevant_doc_ids: Optional[List[int]], limit_rows: int):
+        if relevant_doc_ids is not None:
+            return self.filtered_hybrid_search(query_text, query_embedding, relevant_doc_ids, limit_rows=limit_rows)
+        return self.hybrid_search(query_text, query_embedding, limit_rows=limit_rows)
+
+    @staticmethod
+    def merge_results(result_lists: List[List[Tuple]]) -> List[Tuple]:
+        """Deduplicate result tuples by chunk id, keeping each chunk's best similarity, best first"""
+        best: Dict[int, Tuple] = {}
+        for results in result_lists:
+            for result in results:
+                if result[0] not in best or result[3] > best[result[0]][3]:
+                    best[result[0]] = result
+        return sorted(best.values(), key=lambda r: r[3], reverse=True)
+
+    def cascade_search(
+        self,
+        query_text: str,
+        query_embedding: Union[List[float], np.ndarray],
+        relevant_doc_ids: Optional[List[int]] = None,
+        limit_rows: int = 10,
+        candidate_multiplier: int = 5,
+        latency_budget_ms: Optional[float] = None,
+        use_cross_encoder: bool = False
+    ) -> List[Tuple[int, str, int, float, float]]:
+        """
+        Over-fetch limit_rows * candidate_multiplier hybrid candidates, order them by similarity
+        and optionally rerank the top ones with a cross-encoder, returning the top limit_rows.
+        First-stage similarities are already exact cosine (`<=>` in the RPCs; the local index
+        rescores quantized hits), so the ordering needs no vector fetch. The cross-encoder is
+        skipped when its predicted cost would overrun latency_budget_ms, measured from the start
+        of the call. Returns (id, content, embedding_id, similarity, text_rank) tuples.
+        """
+        start = time.perf_counter()
+        deadline = start + latency_budget_ms / 1000 if latency_budget_ms is not None else None
+
+        fetch_rows = limit_rows * max(1, candidate_multiplier)
+        if relevant_doc_ids is not None:
+            candidates = self.filtered_hybrid_search(query_text, query_embedding, relevant_doc_ids, limit_rows=fetch_rows)
+        else:
+            candidates = self.hybrid_search(query_text, query_embedding, limit_rows=fetch_rows)
+        candidates = [(*c, 0.0) if len(c) == 4 else tuple(c) for c in candidates]  # embedding-only fallback has no text_rank
+        reranked = sorted(candidates, key=lambda r: r[3], reverse=True)
+
+        if use_cross_encoder and len(reranked) > 1:
+            # The cross-encoder only sees the cosine survivors, so its cost stays bounded
+            shortlist = reranked[:limit_rows * 2]
+            if deadline is None or time.perf_counter() + _cross_encoder_timer.estimate(len(shortlist)) <= deadline:
+                stage_start = time.perf_counter()
+                scores = get_cross_encoder().predict([(query_text, r[1]) for r in shortlist])
+                order = np.argsort(-np.asarray(scores))
+                reranked = [shortlist[i] for i in order] + reranked[len(shortlist):]
+                _cross_encoder_timer.record(len(shortlist), time.perf_counter() - stage_start)
+            else:
+                retrieval_metrics.record_skip('cross_encoder')
+
+        return reranked[:limit_rows]
+
+    @staticmethod
+    def cache_stats() -> Dict:
+        """Hit/miss counters of the shared search result cache"""
+        return search_cache.stats()
+
+    @staticmethod
+    def metrics() -> Dict:
+        """Per-RPC latency histograms, rows and payload bytes, hybrid fallback rate and cache hit ratio"""
+        return retrieval_metrics.snapshot(cache_stats=search_cache.stats())
 
     def search_documents(
         self,
@@ -178,13 +381,35 @@ class Retriever:
         Returns list of (id, title, file_path, similarity) tuples.
         """
         query_embedding = self._convert_embedding_to_list(query_embedding)
-        response = self.supabase.rpc(
+        return self._rpc(
             'search_documents',
             {
                 'query_embedding': query_embedding,
                 'limit_rows': limit_rows,
                 'offset_rows': offset_rows
             }
-        ).execute()
-        print("search_docs resp:", response)
-        return response.data
\ No newline at end of file
+        )
+
+    # Async API: the same searches, awaitable from async routes without blocking the event loop.
+    # Calls run on a bounded pool so a burst of requests can't open unlimited connections.
+    async def _run_async(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_rpc_executor, functools.partial(method, *args, **kwargs))
+
+    async def afiltered_hybrid_search(self, *args, **kwargs) -> List[Tuple[int, str, int, float, float]]:
+        return await self._run_async(self.filtered_hybrid_search, *args, **kwargs)
+
+    async def afiltered_search(self, *args, **kwargs) -> List[Tuple[int, str, int, float]]:
+        return await self._run_async(self.filtered_search, *args, **kwargs)
+
+    async def aget_document_ids_by_urls(self, urls: List[str]) -> List[int]:
+        return await self._run_async(self.get_document_ids_by_urls, urls)
+
+    async def ahybrid_search(self, *args, **kwargs) -> List[Tuple[int, str, int, float, float]]:
+        return await self._run_async(self.hybrid_search, *args, **kwargs)
+
+    async def asearch_chunks(self, *args, **kwargs) -> List[Tuple[int, str, int, float]]:
+        return await self._run_async(self.search_chunks, *args, **kwargs)
+
+    async def asearch_documents(self, *args, **kwargs) -> List[Tuple[int, str, str, float]]:
+        return await self._run_async(self.search_documents, *args, **kwargs)
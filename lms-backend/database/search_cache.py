@@ -0,0 +1,99 @@
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple, Union
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+
+class SearchResultCache:
+    """
+    Bounded LRU cache of search results with a time-to-live.
+    Entries remember which documents they searched (None for unfiltered searches) so that
+    ingesting into a document drops every result that could have included it.
+    """
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[Hashable, Tuple[float, Optional[frozenset], Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    @staticmethod
+    def embedding_digest(embedding: Union[List[float], np.ndarray]) -> str:
+        return hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+
+    @classmethod
+    def make_key(
+        cls,
+        kind: str,
+        query_text: Optional[str],
+        query_embedding: Union[List[float], np.ndarray],
+        relevant_doc_ids: Optional[List[int]],
+        limit_rows: int,
+        offset_rows: int
+    ) -> Tuple:
+        doc_ids = tuple(sorted(relevant_doc_ids)) if relevant_doc_ids is not None else None
+        return (kind, query_text, cls.embedding_digest(query_embedding), doc_ids, limit_rows, offset_rows)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: Hashable, value: Any, relevant_doc_ids: Optional[Iterable[int]] = None):
+        doc_ids = frozenset(relevant_doc_ids) if relevant_doc_ids is not None else None
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, doc_ids, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_documents(self, doc_ids: Iterable[int]):
+        """Drop results that searched any of doc_ids, and all unfiltered results"""
+        changed = set(doc_ids)
+        with self.lock:
+            stale = [key for key, (_, entry_doc_ids, _) in self.entries.items()
+                     if entry_doc_ids is None or entry_doc_ids & changed]
+            for key in stale:
+                del self.entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+search_cache = SearchResultCache(
+    max_entries=int(os.getenv("RETRIEVER_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("RETRIEVER_CACHE_TTL", "300"))
+)
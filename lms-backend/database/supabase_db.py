@@ -1,12 +1,36 @@
-from supabase import Client, create_client
+from supabase import Client, ClientOptions, create_client
 from dotenv import load_dotenv
+from typing import Optional
 import os
+import threading
 
 load_dotenv()
 
 project_url = os.getenv("PROJECT_URL")
 project_key = os.getenv("API_KEY")
 
+# Timeout (seconds) for PostgREST/RPC calls made through the shared client
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "20"))
+
 def create_supabase_client():
     supabase: Client = create_client(project_url, project_key)
-    return supabase
\ No newline at end of file
+    return supabase
+
+_shared_client: Optional[Client] = None
+_shared_client_lock = threading.Lock()
+
+def get_supabase_client() -> Client:
+    """
+    Process-wide client whose keep-alive connection pool is reused by every caller,
+    instead of building a new client (and pool) per request.
+    """
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = create_client(
+                    project_url,
+                    project_key,
+                    options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT)
+                )
+    return _shared_client
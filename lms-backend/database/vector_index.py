@@ -0,0 +1,558 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+import json
+import os
+import threading
+import time
+import numpy as np
+from .bm25_index import BM25Index, reciprocal_rank_fusion
+from .quantization import (
+    QUANTIZATION_SCHEMES, binary_scores, int8_scores, quantize_binary, quantize_int8
+)
+from .supabase_db import get_supabase_client
+
+try:
+    import hnswlib
+except ImportError:  # listed in requirements.txt; without it large courses fall back to exact search
+    hnswlib = None
+_warned_no_hnsw = False
+
+HNSW_MIN_ROWS = int(os.getenv("VECTOR_INDEX_HNSW_MIN_ROWS", "20000"))
+# Removed chunks stay in the HNSW graph as deleted nodes until they reach this share of live rows
+HNSW_MAX_DELETED_FRACTION = float(os.getenv("VECTOR_INDEX_HNSW_MAX_DELETED_FRACTION", "0.5"))
+# "int8" or "binary" keeps only compact codes in memory; empty keeps float32 vectors
+VECTOR_INDEX_QUANTIZATION = os.getenv("VECTOR_INDEX_QUANTIZATION", "").lower() or None
+# Seconds before a course index is reloaded, so chunks written by other workers show up
+VECTOR_INDEX_TTL = float(os.getenv("VECTOR_INDEX_TTL", "900"))
+# First-pass candidates per requested row that get rescored at full precision
+RESCORE_MULTIPLIERS = {"int8": 3, "binary": 10}
+
+def parse_embedding(embedding) -> np.ndarray:
+    """pgvector columns come back from PostgREST as '[0.1,0.2,...]' strings"""
+    if isinstance(embedding, str):
+        embedding = json.loads(embedding)
+    return np.asarray(embedding, dtype=np.float32)
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+class CourseVectorIndex:
+    """
+    In-memory copy of one course's chunk vectors, plus a BM25 index over the same chunks.
+    Small courses are searched exactly with one matrix-vector product; courses with at least
+    HNSW_MIN_ROWS chunks also get an HNSW graph when hnswlib is installed. The graph is labelled
+    by chunk id and updated in place: new chunks are inserted, removed ones marked deleted, and
+    it is only rebuilt once deleted nodes pass HNSW_MAX_DELETED_FRACTION of the live rows.
+    Similarities are cosine, like the `<=>` based RPCs.
+
+    With quantization set to "int8" or "binary" only compact codes are held: the first pass
+    scores every code, and just the top limit_rows * rescore_multiplier candidates are rescored
+    with full-precision vectors from vector_source (chunk id -> unit vector, e.g. chunks_embed).
+    """
+    def __init__(
+        self,
+        course_id: int,
+        dim: int = 768,
+        quantization: Optional[str] = None,
+        vector_source: Optional[Callable[[List[int]], Dict[int, np.ndarray]]] = None,
+        rescore_multiplier: Optional[int] = None
+    ):
+        if quantization is not None and quantization not in QUANTIZATION_SCHEMES:
+            raise ValueError(f"Unknown quantization scheme: {quantization}")
+        self.course_id = course_id
+        self.dim = dim
+        self.quantization = quantization
+        self.vector_source = vector_source
+        self.rescore_multiplier = rescore_multiplier or RESCORE_MULTIPLIERS.get(quantization, 1)
+        self.lock = threading.RLock()
+        self.ids = np.empty(0, dtype=np.int64)
+        self.doc_ids = np.empty(0, dtype=np.int64)
+        self.contents: List[str] = []
+        self.matrix = np.empty((0, dim), dtype=np.float32)
+        code_width = dim // 8 if quantization == "binary" else dim
+        self.codes = np.empty((0, code_width), dtype=np.uint8 if quantization == "binary" else np.int8)
+        self.scales = np.empty(0, dtype=np.float32)
+        self.position: Dict[int, int] = {}
+        self.hnsw = None
+        self.graph_deleted = 0
+        self.bm25 = BM25Index()
+        # Documents whose full set of chunks is loaded; others are served by the RPCs
+        self.documents: set = set()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(
+        self,
+        ids: Iterable[int],
+        doc_ids: Iterable[int],
+        contents: List[str],
+        embeddings: Optional[np.ndarray] = None,
+        codes: Optional[np.ndarray] = None,
+        scales: Optional[np.ndarray] = None
+    ):
+        """Append chunks; quantized indexes take precomputed codes/scales or quantize embeddings"""
+        ids, doc_ids = list(ids), list(doc_ids)
+        if self.quantization is not None and codes is None:
+            if self.quantization == "int8":
+                codes, scales = quantize_int8(embeddings)
+            else:
+                codes = quantize_binary(embeddings)
+        with self.lock:
+            self.position.update({int(chunk_id): len(self.ids) + i for i, chunk_id in enumerate(ids)})
+            self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+            self.doc_ids = np.concatenate([self.doc_ids, np.asarray(doc_ids, dtype=np.int64)])
+            self.contents.extend(contents)
+            if self.quantization is None:
+                self.matrix = np.ascontiguousarray(np.vstack([self.matrix, _normalize(np.asarray(embeddings, dtype=np.float32))]))
+            else:
+                self.codes = np.ascontiguousarray(np.vstack([self.codes, np.asarray(codes, dtype=self.codes.dtype)]))
+                if scales is None:
+                    scales = np.ones(len(ids), dtype=np.float32)
+                self.scales = np.concatenate([self.scales, np.asarray(scales, dtype=np.float32)])
+            self._add_to_graph(ids)
+            self.bm25.add(ids, doc_ids, contents)
+
+    def remove(self, chunk_ids: Iterable[int]):
+        chunk_ids = list(chunk_ids)
+        with self.lock:
+            self._drop(~np.isin(self.ids, chunk_ids))
+            self.bm25.remove(chunk_ids)
+
+    def remove_documents(self, doc_ids: Iterable[int]):
+        doc_ids = list(doc_ids)
+        with self.lock:
+            self._drop(~np.isin(self.doc_ids, doc_ids))
+            self.bm25.remove_documents(doc_ids)
+            self.documents.difference_update(doc_ids)
+
+    def mark_documents(self, doc_ids: Iterable[int]):
+        """Record documents whose chunks have all been added"""
+        with self.lock:
+            self.documents.update(doc_ids)
+
+    def missing_documents(self, doc_ids: Iterable[int]) -> List[int]:
+        with self.lock:
+            return [doc_id for doc_id in doc_ids if doc_id not in self.documents]
+
+    def _drop(self, keep: np.ndarray):
+        """Keep only the rows where keep is True (caller holds the lock)"""
+        removed = self.ids[~keep]
+        self.ids = self.ids[keep]
+        self.doc_ids = self.doc_ids[keep]
+        self.contents = [content for content, kept in zip(self.contents, keep) if kept]
+        if self.quantization is None:
+            self.matrix = np.ascontiguousarray(self.matrix[keep])
+        else:
+            self.codes = np.ascontiguousarray(self.codes[keep])
+            self.scales = self.scales[keep]
+        self.position = {int(chunk_id): i for i, chunk_id in enumerate(self.ids)}
+        self._remove_from_graph(removed)
+
+    def _add_to_graph(self, ids: List[int]):
+        """Insert the just-appended rows into the HNSW graph, building it once the course is large enough"""
+        if self.quantization is not None:
+            return
+        if hnswlib is None:
+            global _warned_no_hnsw
+            if not _warned_no_hnsw and len(self.ids) >= HNSW_MIN_ROWS:
+                _warned_no_hnsw = True
+                print(f"hnswlib is not installed; course {self.course_id} has {len(self.ids)} chunks "
+                      f"and large courses will be searched by brute force")
+            return
+        if self.hnsw is None:
+            if len(self.ids) >= HNSW_MIN_ROWS:
+                self._build_graph()
+            return
+        needed = self.hnsw.get_current_count() + len(ids)
+        if needed > self.hnsw.get_max_elements():
+            self.hnsw.resize_index(max(needed, 2 * self.hnsw.get_max_elements()))
+        # Re-adding a deleted label (an overwritten chunk) un-deletes and updates that node
+        self.hnsw.add_items(self.matrix[len(self.ids) - len(ids):], np.asarray(ids, dtype=np.int64))
+
+    def _remove_from_graph(self, removed: np.ndarray):
+        if self.hnsw is None or not len(removed):
+            return
+        if len(self.ids) < HNSW_MIN_ROWS:
+            self.hnsw = None
+            return
+        for chunk_id in removed:
+            self.hnsw.mark_deleted(int(chunk_id))
+        self.graph_deleted += len(removed)
+        # Deleted nodes are still traversed, so compact the graph once they pile up
+        if self.graph_deleted > HNSW_MAX_DELETED_FRACTION * len(self.ids):
+            self._build_graph()
+
+    def _build_graph(self):
+        graph = hnswlib.Index(space='ip', dim=self.dim)
+        graph.init_index(max_elements=len(self.ids) + len(self.ids) // 4, ef_construction=200, M=16)
+        graph.add_items(self.matrix, self.ids)
+        graph.set_ef(128)
+        self.hnsw = graph
+        self.graph_deleted = 0
+
+    def nbytes(self) -> int:
+        """Memory held by the vectors or codes (excluding contents and BM25)"""
+        return self.matrix.nbytes + self.codes.nbytes + self.scales.nbytes
+
+    def vectors_for(self, chunk_ids: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Unit vectors for the given chunk ids that are in this index (none when quantized)"""
+        if self.quantization is not None:
+            return {}
+        with self.lock:
+            return {chunk_id: self.matrix[self.position[chunk_id]] for chunk_id in chunk_ids if chunk_id in self.position}
+
+    def search(
+        self,
+        query_embedding: Union[List[float], np.ndarray],
+        relevant_doc_ids: Optional[List[int]] = None,
+        limit_rows: int = 10,
+        offset_rows: int = 0,
+        rescore: bool = True
+    ) -> List[Tuple[int, str, int, float]]:
+        """
+        Return (id, content, embedding_id, similarity) tuples, most similar first.
+        rescore=False returns the first-pass quantized similarities as they are.
+        """
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        wanted = limit_rows + offset_rows
+        if self.quantization is not None:
+            return self._quantized_search(query, relevant_doc_ids, wanted, offset_rows, rescore)
+        with self.lock:
+            if not len(self.ids):
+                return []
+            mask = np.isin(self.doc_ids, relevant_doc_ids) if relevant_doc_ids is not None else None
+
+            positions, scores = None, None
+            if self.hnsw is not None:
+                # Over-ask the graph so that filtering by document still leaves enough hits
+                k = min(len(self.ids), wanted * 4 if mask is None else wanted * 16)
+                labels, distances = self.hnsw.knn_query(query, k=k)
+                labels = np.fromiter((self.position[int(label)] for label in labels[0]), dtype=np.int64, count=len(labels[0]))
+                similarities = 1.0 - distances[0]
+                if mask is not None:
+                    keep = mask[labels]
+                    labels, similarities = labels[keep], similarities[keep]
+                if len(labels) >= wanted or (mask is not None and len(labels) >= mask.sum()):
+                    positions, scores = labels, similarities
+
+            if positions is None:
+                candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(self.ids))
+                similarities = self.matrix[candidates] @ query
+                top = np.argsort(-similarities)[:wanted] if wanted < len(candidates) else np.argsort(-similarities)
+                positions, scores = candidates[top], similarities[top]
+
+            return [
+                (int(self.ids[p]), self.contents[p], int(self.doc_ids[p]), float(score))
+                for p, score in list(zip(positions, scores))[offset_rows:wanted]
+            ]
+
+    def _quantized_search(self, query: np.ndarray, relevant_doc_ids, wanted: int, offset_rows: int, rescore: bool):
+        shortlist_size = wanted * self.rescore_multiplier if rescore else wanted
+        with self.lock:
+            if not len(self.ids):
+                return []
+            if relevant_doc_ids is not None:
+                candidates = np.flatnonzero(np.isin(self.doc_ids, relevant_doc_ids))
+                codes, scales = self.codes[candidates], self.scales[candidates]
+            else:
+                candidates, codes, scales = np.arange(len(self.ids)), self.codes, self.scales
+            if self.quantization == "int8":
+                similarities = int8_scores(codes, scales, query)
+            else:
+                similarities = binary_scores(codes, query, self.dim)
+            if shortlist_size < len(candidates):
+                top = np.argpartition(-similarities, shortlist_size - 1)[:shortlist_size]
+            else:
+                top = np.arange(len(candidates))
+            shortlist = [
+                (int(self.ids[p]), self.contents[p], int(self.doc_ids[p]), float(score))
+                for p, score in zip(candidates[top], similarities[top])
+            ]
+
+        # Full-precision vectors are fetched outside the lock, and only for the shortlist
+        if rescore and self.vector_source is not None and shortlist:
+            vectors = self.vector_source([r[0] for r in shortlist])
+            shortlist = [
+                (r[0], r[1], r[2], float(vectors[r[0]] @ query)) if r[0] in vectors else r
+                for r in shortlist
+            ]
+        shortlist.sort(key=lambda r: r[3], reverse=True)
+        return shortlist[offset_rows:wanted]
+
+    def _full_vectors(self, chunk_ids: List[int]) -> Dict[int, np.ndarray]:
+        if self.quantization is None:
+            return self.vectors_for(chunk_ids)
+        return self.vector_source(chunk_ids) if self.vector_source is not None else {}
+
+    def hybrid_search(
+        self,
+        query_text: str,
+        query_embedding: Union[List[float], np.ndarray],
+        relevant_doc_ids: Optional[List[int]] = None,
+        limit_rows: int = 10,
+        candidates: int = 50
+    ) -> List[Tuple[int, str, int, float, float, float]]:
+        """
+        Fuse the dense and BM25 rankings with reciprocal rank fusion.
+        Returns (id, content, embedding_id, similarity, text_rank, fused score) tuples, best first.
+        Quantized indexes rank by first-pass similarity and rescore only the fused top rows.
+        """
+        candidates = max(candidates, limit_rows)
+        dense = self.search(query_embedding, relevant_doc_ids, candidates, rescore=False)
+        lexical = self.bm25.search(query_text, relevant_doc_ids, candidates)
+        fused = reciprocal_rank_fusion([[r[0] for r in dense], [chunk_id for chunk_id, _ in lexical]])[:limit_rows]
+
+        similarity = {r[0]: r[3] for r in dense}
+        text_rank = dict(lexical)
+        if self.quantization is None:
+            missing = [chunk_id for chunk_id, _ in fused if chunk_id not in similarity]
+        else:
+            missing = [chunk_id for chunk_id, _ in fused]
+        if missing:
+            # Lexical-only hits (and quantized first-pass hits) report their exact cosine similarity
+            query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+            similarity.update({chunk_id: float(vector @ query) for chunk_id, vector in self._full_vectors(missing).items()})
+        with self.lock:
+            position = self.position
+            return [
+                (chunk_id, self.contents[position[chunk_id]], int(self.doc_ids[position[chunk_id]]),
+                 similarity.get(chunk_id, 0.0), text_rank.get(chunk_id, 0.0), score)
+                for chunk_id, score in fused if chunk_id in position
+            ]
+
+class VectorIndexRegistry:
+    """
+    Per-course indexes loaded lazily from chunks_embed and shared by every Retriever in the process.
+    Quantization is purely in-memory: float vectors are read from the embedding column and only
+    the codes are kept, with rescoring reading the shortlist's floats back from chunks_embed.
+
+    Only documents whose chunks are all present (chunk count == document_embed.total_chunks) are
+    served locally. Documents ingested by another worker are loaded on first request, and each
+    course is reloaded after ttl_seconds so re-ingests and deletions elsewhere are picked up.
+    search and hybrid_search return None when a document can't be served yet (e.g. it is still
+    being ingested); callers then use the RPCs.
+    """
+    def __init__(
+        self,
+        page_size: int = 1000,
+        quantization: Optional[str] = VECTOR_INDEX_QUANTIZATION,
+        ttl_seconds: float = VECTOR_INDEX_TTL
+    ):
+        self.page_size = page_size
+        self.quantization = quantization
+        self.ttl_seconds = ttl_seconds
+        self.indexes: Dict[int, CourseVectorIndex] = {}
+        self.expires: Dict[int, float] = {}
+        self.doc_to_course: Dict[int, int] = {}
+        self.lock = threading.Lock()
+        self.load_locks: Dict[int, threading.Lock] = {}
+
+    @property
+    def supabase(self):
+        return get_supabase_client()
+
+    def _load_lock(self, course_id: int) -> threading.Lock:
+        with self.lock:
+            return self.load_locks.setdefault(course_id, threading.Lock())
+
+    def _cached(self, course_id: int) -> Optional[CourseVectorIndex]:
+        with self.lock:
+            index = self.indexes.get(course_id)
+            if index is not None and time.monotonic() < self.expires[course_id]:
+                return index
+        return None
+
+    def get(self, course_id: int) -> CourseVectorIndex:
+        index = self._cached(course_id)
+        if index is not None:
+            return index
+        with self._load_lock(course_id):
+            # Another thread may have (re)loaded the course while this one waited
+            index = self._cached(course_id)
+            if index is None:
+                index = self._load(course_id)
+                with self.lock:
+                    self.indexes[course_id] = index
+                    self.expires[course_id] = time.monotonic() + self.ttl_seconds
+        return index
+
+    def _load(self, course_id: int) -> CourseVectorIndex:
+        documents = self.supabase.table('document_embed').select('id, total_chunks').eq('course_id', course_id).execute()
+        index = CourseVectorIndex(course_id, quantization=self.quantization, vector_source=self.fetch_vectors)
+        with self.lock:
+            self.doc_to_course = {
+                doc_id: course for doc_id, course in self.doc_to_course.items() if course != course_id
+            }
+            self.doc_to_course.update({row['id']: course_id for row in documents.data})
+        loaded = self._load_documents(index, {row['id']: row['total_chunks'] or 0 for row in documents.data})
+        detail = f" ({self.quantization})" if self.quantization else ""
+        print(f"loaded local vector index for course {course_id}: {len(index.ids)} chunks "
+              f"from {loaded}/{len(documents.data)} documents{detail}")
+        return index
+
+    def _load_documents(self, index: CourseVectorIndex, total_chunks: Dict[int, int]) -> int:
+        """
+        Add the chunks of documents (id -> expected chunk count) to index. Documents whose stored
+        chunks don't match the expected count are mid-ingest and are skipped. Returns how many loaded.
+        """
+        if not total_chunks:
+            return 0
+        rows = []
+        last_id = 0
+        while True:
+            response = self.supabase.table('chunks_embed')\
+                .select('id, embedding_id, content, embedding')\
+                .in_('embedding_id', list(total_chunks))\
+                .gt('id', last_id)\
+                .order('id')\
+                .limit(self.page_size)\
+                .execute()
+            rows.extend(response.data)
+            if len(response.data) < self.page_size:
+                break
+            last_id = response.data[-1]['id']
+
+        counts: Dict[int, int] = {}
+        for row in rows:
+            counts[row['embedding_id']] = counts.get(row['embedding_id'], 0) + 1
+        complete = {doc_id for doc_id, expected in total_chunks.items() if counts.get(doc_id, 0) == expected}
+        rows = [row for row in rows if row['embedding_id'] in complete]
+        # Added a page at a time so quantized indexes never hold the whole course as floats
+        for start in range(0, len(rows), self.page_size):
+            page = rows[start:start + self.page_size]
+            index.add(
+                [row['id'] for row in page],
+                [row['embedding_id'] for row in page],
+                [row['content'] for row in page],
+                np.stack([parse_embedding(row['embedding']) for row in page])
+            )
+        index.mark_documents(complete)
+        return len(complete)
+
+    def _ensure_documents(self, course_id: int, index: CourseVectorIndex, doc_ids: List[int]) -> bool:
+        """Load any of doc_ids the index doesn't hold yet; False if some still can't be served"""
+        if not index.missing_documents(doc_ids):
+            return True
+        with self._load_lock(course_id):
+            missing = index.missing_documents(doc_ids)
+            if not missing:
+                return True
+            response = self.supabase.table('document_embed')\
+                .select('id, total_chunks')\
+                .in_('id', missing)\
+                .execute()
+            self._load_documents(index, {row['id']: row['total_chunks'] or 0 for row in response.data})
+        # Documents deleted since they were mapped to this course have no chunks to serve
+        existing = {row['id'] for row in response.data}
+        return not [doc_id for doc_id in index.missing_documents(doc_ids) if doc_id in existing]
+
+    def _course_indexes(self, relevant_doc_ids: List[int]) -> Optional[List[Tuple[CourseVectorIndex, List[int]]]]:
+        """Loaded (index, doc ids) pairs covering relevant_doc_ids, or None if any can't be served locally"""
+        pairs = []
+        for course_id, course_doc_ids in self.courses_for_documents(relevant_doc_ids).items():
+            index = self.get(course_id)
+            if not self._ensure_documents(course_id, index, course_doc_ids):
+                return None
+            pairs.append((index, course_doc_ids))
+        return pairs
+
+    def courses_for_documents(self, doc_ids: List[int]) -> Dict[int, List[int]]:
+        """Group document ids by course, looking up documents this registry hasn't seen yet"""
+        with self.lock:
+            unknown = [doc_id for doc_id in doc_ids if doc_id not in self.doc_to_course]
+        if unknown:
+            response = self.supabase.table('document_embed').select('id, course_id').in_('id', unknown).execute()
+            with self.lock:
+                self.doc_to_course.update({row['id']: row['course_id'] for row in response.data})
+        grouped: Dict[int, List[int]] = {}
+        with self.lock:
+            for doc_id in doc_ids:
+                if doc_id in self.doc_to_course:
+                    grouped.setdefault(self.doc_to_course[doc_id], []).append(doc_id)
+        return grouped
+
+    def search(
+        self,
+        query_embedding: Union[List[float], np.ndarray],
+        relevant_doc_ids: List[int],
+        limit_rows: int = 10,
+        offset_rows: int = 0
+    ) -> Optional[List[Tuple[int, str, int, float]]]:
+        """Search the chunks of the given documents across whichever courses they belong to"""
+        pairs = self._course_indexes(relevant_doc_ids)
+        if pairs is None:
+            return None
+        results = []
+        for index, course_doc_ids in pairs:
+            results.extend(index.search(query_embedding, course_doc_ids, limit_rows + offset_rows))
+        results.sort(key=lambda r: r[3], reverse=True)
+        return results[offset_rows:offset_rows + limit_rows]
+
+    def hybrid_search(
+        self,
+        query_text: str,
+        query_embedding: Union[List[float], np.ndarray],
+        relevant_doc_ids: List[int],
+        limit_rows: int = 10,
+        offset_rows: int = 0
+    ) -> Optional[List[Tuple[int, str, int, float, float]]]:
+        """
+        Local replacement for the hybrid-search RPCs: BM25 + dense ranks fused per course.
+        Returns (id, content, embedding_id, similarity, text_rank) tuples, best first.
+        """
+        pairs = self._course_indexes(relevant_doc_ids)
+        if pairs is None:
+            return None
+        results = []
+        for index, course_doc_ids in pairs:
+            results.extend(index.hybrid_search(query_text, query_embedding, course_doc_ids, limit_rows + offset_rows))
+        results.sort(key=lambda r: r[5], reverse=True)
+        return [r[:5] for r in results[offset_rows:offset_rows + limit_rows]]
+
+    def add_chunks(self, course_id: int, document_id: int, ids: List[int], contents: List[str], embeddings: np.ndarray):
+        """Append newly ingested chunks to a loaded index; unloaded courses pick them up on first load"""
+        with self.lock:
+            self.doc_to_course[document_id] = course_id
+            index = self.indexes.get(course_id)
+        if index is not None:
+            index.add(ids, [document_id] * len(ids), contents, embeddings)
+            index.mark_documents([document_id])
+
+    def remove_chunks(self, course_id: int, chunk_ids: List[int]):
+        """Drop chunks from a loaded index; unloaded courses read the current rows on first load"""
+        with self.lock:
+            index = self.indexes.get(course_id)
+        if index is not None and chunk_ids:
+            index.remove(chunk_ids)
+
+    def cached_vectors(self, chunk_ids: List[int]) -> Dict[int, np.ndarray]:
+        """Unit vectors for whichever of chunk_ids are in an already loaded course index"""
+        with self.lock:
+            indexes = list(self.indexes.values())
+        found: Dict[int, np.ndarray] = {}
+        for index in indexes:
+            found.update(index.vectors_for([chunk_id for chunk_id in chunk_ids if chunk_id not in found]))
+            if len(found) == len(chunk_ids):
+                break
+        return found
+
+    def fetch_vectors(self, chunk_ids: List[int]) -> Dict[int, np.ndarray]:
+        """Unit vectors for chunk_ids, from loaded indexes where possible and chunks_embed otherwise"""
+        found = self.cached_vectors(chunk_ids)
+        missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in found]
+        for start in range(0, len(missing), 100):
+            response = self.supabase.table('chunks_embed')\
+                .select('id, embedding')\
+                .in_('id', missing[start:start + 100])\
+                .execute()
+            for row in response.data:
+                found[row['id']] = _normalize(parse_embedding(row['embedding']))
+        return found
+
+    def invalidate_course(self, course_id: int):
+        """Drop a course's index so the next search reloads it from chunks_embed"""
+        with self.lock:
+            self.indexes.pop(course_id, None)
+            self.expires.pop(course_id, None)
+
+vector_indexes = VectorIndexRegistry()
@@ -1,3 +1,4 @@
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from database.supabase_db import create_supabase_client
@@ -8,6 +9,8 @@ from routes.auth_routes import auth_router
 from routes.course_routes import course_router
 from routes.generation_routes import generation_router
 from routes.summarization_routes import summarization_router
+from utils.embedding_models import warm_up_embedding_models
+from utils.llm_client import aclose_llm_clients
 
 app = FastAPI()
 
@@ -22,6 +25,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Embedding models load lazily on first use unless warm-up is requested
+@app.on_event("startup")
+def warm_up_models():
+    if os.getenv("EMBEDDING_WARMUP", "false").lower() in ("1", "true", "yes"):
+        warm_up_embedding_models()
+
+@app.on_event("shutdown")
+async def close_llm_connections():
+    await aclose_llm_clients()
+
 # Setting up the imported routers
 app.include_router(auth_router, prefix="/api")
 app.include_router(course_router, prefix="/api/courses")
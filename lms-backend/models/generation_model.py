@@ -13,6 +13,7 @@ class AssignmentState(TypedDict):
     optimized_query: str     # optimized query for rag after metaprocessing
     human_feedback: str
     assignment_prev_version: str
+    retrieved_chunks: Optional[List[tuple]]  # search results prefetched by speculative retrieval
 
 
 class PracticeQAState(TypedDict):
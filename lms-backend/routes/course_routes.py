@@ -1,12 +1,16 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, HTTPException, Query
 from database.supabase_db import create_supabase_client
+from database.document_id_cache import document_ids
 from datetime import datetime, timezone
 from models.course_model import Course, CourseCreate, CourseEnrollment
 from models.user_model import User
 from utils.storage_manager import StorageManager
+from utils.downloads import download_to_file
+from utils.ingestion_jobs import ingestion_queue, IngestionQueueFullError
 import os
+import shutil
+import tempfile
 from typing import Optional
-import requests
 
 course_router = APIRouter()
 supabase = create_supabase_client()
@@ -62,10 +66,19 @@ def get_all_courses():
         print("Error:", e)
         return {"message": "Failed to retrieve courses"}
 
+def warm_course_document_ids(course_id: int):
+    """Preload the file path -> document id map, so generation requests for this course skip the lookup"""
+    try:
+        print(f"cached document ids for {document_ids.warm_course(course_id)} files of course {course_id}")
+    except Exception as e:
+        print("got-exception-warming-document-ids", course_id, e)
+
 # Route to retrieve a specific course and its enrollments by course ID
 @course_router.get("/get_course/{course_ID}")
-def get_course_by_id(course_ID: int):
+def get_course_by_id(course_ID: int, background_tasks: BackgroundTasks):
     print("Course ID received:", course_ID)
+    # Opening a course comes before generating from its files
+    background_tasks.add_task(warm_course_document_ids, course_ID)
     try:
         course_response = supabase.from_("courses").select("*").eq("id", course_ID).execute()
         enrolments_response = supabase.from_("courseEnrolments").select("*").eq("course_id", course_ID).execute()
@@ -175,6 +188,30 @@ def get_courses_by_ids(course_ids: list[int]):
         print("Error:", e)
         return {"message": "Failed to retrieve courses", "error": str(e)}
 
+def ingest_course_file(progress, course_id: int, file_path: str, signed_url: str, folder: str, filename: str):
+    """Download a course file and store its embeddings; runs on the ingestion worker pool"""
+    # Each job gets its own directory so concurrent uploads of the same filename don't collide
+    temp_dir = tempfile.mkdtemp(prefix="ingest_")
+    temp_file_path = os.path.join(temp_dir, f"temp_{filename}")
+    try:
+        # Stream the file from the signed URL straight to disk
+        with open(temp_file_path, "wb") as buffer:
+            download_to_file(signed_url, buffer)
+        print("wrote temp files locally ", temp_file_path)
+
+        # Process the file using StorageManager
+        return storage_manager.process_file(
+            file_path=temp_file_path,
+            course_id=course_id,
+            originalFilePath= file_path,
+            folder= folder,
+            progress=progress
+        )
+
+    finally:
+        # Clean up temporary file
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
 @course_router.post("/process_file")
 async def process_course_file(
     courseId: str = Query(...),
@@ -183,7 +220,6 @@ async def process_course_file(
 ):
     print("courseID:", courseId,"filePath:", filePath)
     # print("signedUrl:", signedUrl)
-    signed_url = signedUrl
     try:
         # Extract folder and filename from filePath
         parts = filePath.split('/')
@@ -191,39 +227,34 @@ async def process_course_file(
         folder = parts[1]
         filename = parts[2]
 
-        try:
-            # Download the file using the signed URL
-            response = requests.get(signed_url)
-            response.raise_for_status()
-            file_data = response.content
-            # print("got cont", file_data)
-
-            # Create a temporary file to store the download
-            temp_file_path = f"temp_{filename}"
-            with open(temp_file_path, "wb") as buffer:
-                buffer.write(file_data)
-            print("wrote temp files locally ", temp_file_path)
-
-            # Process the file using StorageManager
-            result = storage_manager.process_file(
-                file_path=temp_file_path,
-                course_id=course_id,
-                originalFilePath= filePath,
-                folder= folder
-            )
-            # print("processed file w storage manager")
-            return {
-                "message": "File uploaded and processed successfully",
-                "embedding_info": result
-            }
-
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+        job_id = ingestion_queue.submit(
+            ingest_course_file,
+            course_id=course_id,
+            file_path=filePath,
+            signed_url=signedUrl,
+            folder=folder,
+            filename=filename
+        )
+        return {
+            "message": "File queued for processing",
+            "job_id": job_id
+        }
 
+    except IngestionQueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many files are being processed, try again shortly: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to process file: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+# Route for polling the status and progress of a file processing job
+@course_router.get("/process_file/{job_id}")
+def get_process_file_status(job_id: str):
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
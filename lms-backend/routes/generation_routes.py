@@ -3,7 +3,11 @@ import os
 import logging
 from database.retriever import Retriever
 from fastapi import APIRouter, HTTPException, Request
-from utils.generation_workflow import generate_assignment_workflow, generate_practice_qa_workflow
+from starlette.concurrency import run_in_threadpool
+from utils.generation_workflow import (
+    generate_assignment_workflow, generate_practice_qa_workflow, stream_assignment_workflow, stream_practice_qa_workflow
+)
+from utils.sse import sse_response
 from models.generation_model import AssignmentRequest, QuizRequest, SummarizeRequest, PracticeQARequest
 
 # Set up logging
@@ -18,7 +22,8 @@ async def generate_assignment(request: AssignmentRequest):
     try:
         print("hitting router, urls should be filepaths not urls", request.lecture_urls)
         print(request)
-        result = generate_assignment_workflow(
+        result = await run_in_threadpool(
+            generate_assignment_workflow,
             input_content=request.prompt,
             openrouter_api_key=os.getenv("OPENROUTER_API_KEY"),
             together_api_key=os.getenv("TOGETHER_API_KEY"),
@@ -58,7 +63,8 @@ async def generate_quiz(request: QuizRequest):
     """
     try:
         print("hitting router, urls should be filepaths not urls", request.lecture_urls)
-        result = generate_assignment_workflow(
+        result = await run_in_threadpool(
+            generate_assignment_workflow,
             input_content=request.prompt,
             openrouter_api_key=os.getenv("OPENROUTER_API_KEY"),
             together_api_key=os.getenv("TOGETHER_API_KEY"),
@@ -83,6 +89,33 @@ async def generate_quiz(request: QuizRequest):
         )
 
 
+@generation_router.post("/generate-quiz/stream")
+async def stream_quiz(request: QuizRequest):
+    """
+    /generate-quiz as server-sent events: `progress` after each workflow step (retrieval,
+    draft N, score), `token` for draft text as it is generated, then `result` with the
+    same body as /generate-quiz or `error`.
+    """
+    def events():
+        for event, data in stream_assignment_workflow(
+            input_content=request.prompt,
+            openrouter_api_key=os.getenv("OPENROUTER_API_KEY"),
+            together_api_key=os.getenv("TOGETHER_API_KEY"),
+            assignmentorquiz="quiz",
+            human_feedback="",
+            prev_version="",
+            urls=request.lecture_urls
+        ):
+            if event != "done":
+                yield event, data
+            elif data["status"] == "failed":
+                yield "error", {"status_code": 400, "detail": data["assignment"]}
+            else:
+                yield "result", {"status": "success", "assignment": data["assignment"], "score": data["scores"][-1]}
+
+    return sse_response(events())
+
+
 @generation_router.post("/summarize-lecture")
 async def summarize_lecture(request: SummarizeRequest):
     """
@@ -93,7 +126,7 @@ async def summarize_lecture(request: SummarizeRequest):
 
         # Get document ID for the lecture URL
         logger.info("Fetching document IDs for URL")
-        doc_ids = retriever.get_document_ids_by_urls([request.lecture_url])
+        doc_ids = await retriever.aget_document_ids_by_urls([request.lecture_url])
         logger.info(f"Retrieved document IDs: {doc_ids}")
 
         if not doc_ids:
@@ -103,16 +136,15 @@ async def summarize_lecture(request: SummarizeRequest):
                 detail="Lecture not found"
             )
 
-        # Get all chunks for this document
-        logger.info(f"Performing filtered search for doc_ids: {doc_ids}")
-        chunks = retriever.filtered_search(
-            query_embedding=[0] * 768,  # Dummy embedding since we want all chunks
-            relevant_doc_ids=doc_ids,
-            limit_rows=100  # Get all chunks
-        )
+        # Read all chunks of the lecture in order, a page at a time
+        logger.info(f"Reading chunks for doc_ids: {doc_ids}")
+
+        def read_lecture():
+            return [chunk['content'] for chunk in retriever.iter_document_chunks(doc_ids)]
+
+        chunks = await run_in_threadpool(read_lecture)
         logger.info(f"Retrieved {len(chunks)} chunks")
 
-        # Validate chunk format
         if not chunks:
             logger.warning("No chunks retrieved for the document")
             raise HTTPException(
@@ -120,17 +152,7 @@ async def summarize_lecture(request: SummarizeRequest):
                 detail="No content found for the lecture"
             )
 
-        # Extract content from chunks
-        content = []
-        for i, chunk in enumerate(chunks):
-            if not isinstance(chunk, dict) or 'content' not in chunk:
-                logger.error(f"Invalid chunk format at index {i}: {chunk}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="Invalid chunk format returned from retriever"
-                )
-            content.append(chunk['content'])
-        content = "\n".join(content)
+        content = "\n".join(chunks)
         logger.info(f"Extracted content length: {len(content)} characters")
 
         if not content.strip():
@@ -169,7 +191,8 @@ async def summarize_lecture(request: SummarizeRequest):
 @generation_router.post("/generate-practiceqas")
 async def generate_practiceqas(request: PracticeQARequest):
     try:
-        result = generate_practice_qa_workflow(
+        result = await run_in_threadpool(
+                generate_practice_qa_workflow,
                 input_content=request.prompt,
                 openrouter_api_key=os.getenv("OPENROUTER_API_KEY"),
                 difficulty=request.difficulty,
@@ -187,4 +210,29 @@ async def generate_practiceqas(request: PracticeQARequest):
         raise HTTPException(
             status_code=500,
             detail=f"Failed to generate practice Q/A s: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@generation_router.post("/generate-practiceqas/stream")
+async def stream_practiceqas(request: PracticeQARequest):
+    """/generate-practiceqas as server-sent events (progress, token, then result or error)"""
+    def events():
+        for event, data in stream_practice_qa_workflow(
+            input_content=request.prompt,
+            openrouter_api_key=os.getenv("OPENROUTER_API_KEY"),
+            difficulty=request.difficulty,
+            urls=request.lecture_urls
+        ):
+            if event != "done":
+                yield event, data
+            elif data["status"] == "invalid":
+                yield "error", {"status_code": 400, "detail": data["practiceqas"]}
+            else:
+                yield "result", {"status": "success", "practice": data["practiceqas"]}
+
+    return sse_response(events())
+
+
+@generation_router.get("/retrieval-metrics")
+async def retrieval_metrics():
+    """Retrieval latency histograms, row/payload counters, hybrid fallback rate and cache hit ratio"""
+    return Retriever.metrics()
@@ -1,22 +1,25 @@
 from fastapi import APIRouter
+from starlette.concurrency import run_in_threadpool
 from database.supabase_db import create_supabase_client
 from models.summarization_model import SummarizationRequest, FlashcardsRequest, ChatRequest
 import pypdf
 import os
-import requests
 import json
-import tempfile
 from dotenv import load_dotenv
+from utils.downloads import download_to_tempfile
+from utils.llm_cache import llm_cache
+from utils.llm_client import astream_chat_completion, chat_completion
+from utils.sse import sse_response
 
 load_dotenv()
 
 API_TOKEN = os.getenv("API_TOKEN")
 API_URL = os.getenv("API_URL")
 
-headers = {
-    'Authorization': f'Bearer {API_TOKEN}',
-    'Content-Type': 'application/json',
-}
+NO_TEXT_MESSAGE = "No text could be extracted from the provided files."
+SUMMARY_TOO_SHORT_MESSAGE = "Insufficient content for a meaningful summary. Please ensure the lecture content is clear and contains enough information."
+FLASHCARDS_TOO_SHORT_MESSAGE = "Insufficient content for meaningful flashcards. Please ensure the lecture content is clear and contains enough information."
+CHAT_FALLBACK_MESSAGE = "I apologize, but I couldn't generate a meaningful response. Please try rephrasing your question."
 
 summarization_router = APIRouter()
 supabase = create_supabase_client()
@@ -95,52 +98,23 @@ def preprocess_text(text):
 #         print(f'API Error: {response.status_code} - {response.text}')
 #         return None
 
-def query_openrouter_api(user_prompt, model="meta-llama/llama-4-maverick:free"):
-    payload = {
-        "model": model,
-        "messages": [
-            {
-                "role": "user",
-                "content": user_prompt
-            }
-        ]
-    }
-
-    response = requests.post(API_URL, headers=headers, json=payload)
-    print("The response is:", response.json())
-
-    if response.status_code == 200:
-        try:
-            response_data = response.json()
-            if "choices" in response_data and len(response_data["choices"]) > 0:
-                return response_data["choices"][0]["message"]["content"]
-            else:
-                print("Unexpected response structure:", response_data)
-                return None
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON response: {e}")
-            return None
-    else:
-        print(f'API Error: {response.status_code} - {response.text}')
+async def query_openrouter_api(user_prompt, model="meta-llama/llama-4-maverick:free", cache=True):
+    # Repeated requests over the same lecture and prompt are answered from the response cache
+    try:
+        return await chat_completion(user_prompt, model, API_TOKEN, url=API_URL, cache=cache)
+    except Exception as e:
+        print(f"Error querying LLM API: {e}")
         return None
 
 
-@summarization_router.post("/generate_summarization")
-async def generate_summarization(request: SummarizationRequest):
-    print("Summarization request received at backend", request)
-
+def extract_lecture_text(lecture_urls):
+    """Download each lecture file and concatenate its text; files that fail are skipped"""
     combined_text = ""
 
-    for url in request.lecture_urls:
+    for url in lecture_urls:
         try:
-            # Download the file from the Supabase signed URL
-            response = requests.get(url)
-            response.raise_for_status()
-
-            # Create a temporary file and write the content
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                tmp.write(response.content)
-                tmp_path = tmp.name
+            # Stream the file from the Supabase signed URL into a temporary file
+            tmp_path = download_to_tempfile(url, suffix=".pdf")
 
             print(f"Downloaded lecture file to temp path: {tmp_path}")
 
@@ -154,18 +128,10 @@ async def generate_summarization(request: SummarizationRequest):
         except Exception as e:
             print(f"Error processing file {url}: {e}")
             continue
+    return combined_text
 
-    if not combined_text.strip():
-        return {"summary": "No text could be extracted from the provided files."}
-
-    # print("Text extracted from the uploaded files", text)
-
-    # Preprocess the extracted text
-    preprocessed_text = preprocess_text(combined_text)
-    # print("Preprocessed text", preprocessed_text)
-
-    # Combine the custom prompt with extracted content
-    full_prompt = (
+def build_summarization_prompt(request, preprocessed_text):
+    return (
         "You are an expert educational summarizer with years of experience in creating clear, concise, and comprehensive summaries of academic content. "
         "Your task is to analyze the provided lecture content and generate a high-quality summary that captures the essence of the material while maintaining accuracy and clarity.\n\n"
         "Guidelines for creating the summary:\n"
@@ -211,55 +177,8 @@ async def generate_summarization(request: SummarizationRequest):
         "Summary:"
     )
 
-    # Generate the summary using the user-defined prompt
-    summary = query_openrouter_api(full_prompt, model="meta-llama/llama-4-maverick:free")
-    print("Summary generated", summary)
-
-    # Add guardrails for the summary
-    if not summary or len(summary.strip()) < 50:
-        return {"summary": "Insufficient content for a meaningful summary. Please ensure the lecture content is clear and contains enough information."}
-
-    return {"summary": summary}
-
-@summarization_router.post("/generate_flashcards")
-async def generate_flashcards(request: FlashcardsRequest):
-    print("Flashcards request received at backend", request)
-
-    combined_text = ""
-
-    for url in request.lecture_urls:
-        try:
-            # Download the file from the Supabase signed URL
-            response = requests.get(url)
-            response.raise_for_status()
-
-            # Create a temporary file and write the content
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                tmp.write(response.content)
-                tmp_path = tmp.name
-
-            print(f"Downloaded lecture file to temp path: {tmp_path}")
-
-            # Extract text from the downloaded file
-            text = extract_text_from_file(tmp_path)
-            combined_text += text + "\n"
-
-            # Optionally delete the temp file
-            os.remove(tmp_path)
-
-        except Exception as e:
-            print(f"Error processing file {url}: {e}")
-            continue
-
-    if not combined_text.strip():
-        return {"flashcards": "No text could be extracted from the provided files."}
-
-    # Preprocess the extracted text
-    preprocessed_text = preprocess_text(combined_text)
-    print("Preprocessed text", preprocessed_text)
-
-    # Combine the custom prompt with extracted content
-    full_prompt = (
+def build_flashcards_prompt(request, preprocessed_text):
+    return (
         "You are an expert educational content creator specializing in creating effective flashcards for academic learning. "
         "Your task is to analyze the provided lecture content and generate high-quality flashcards that promote deep understanding and retention of key concepts.\n\n"
         "Guidelines for creating flashcards:\n"
@@ -314,52 +233,7 @@ async def generate_flashcards(request: FlashcardsRequest):
         "***<Topic2>***\n"
     )
 
-    # Generate the flashcards using the user-defined prompt
-    flashcards = query_openrouter_api(full_prompt, model="meta-llama/llama-4-maverick:free")
-    print("Flashcards generated", flashcards)
-
-    # Add guardrails for the flashcards
-    if not flashcards or len(flashcards.strip()) < 50:
-        return {"flashcards": "Insufficient content for meaningful flashcards. Please ensure the lecture content is clear and contains enough information."}
-
-    return {"flashcards": flashcards}
-
-@summarization_router.post("/chat_with_lecture")
-async def chat_with_lecture(request: ChatRequest):
-    print("Chat request received at backend", request)
-
-    combined_text = ""
-
-    for url in request.lecture_urls:
-        try:
-            # Download the file from the Supabase signed URL
-            response = requests.get(url)
-            response.raise_for_status()
-
-            # Create a temporary file and write the content
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                tmp.write(response.content)
-                tmp_path = tmp.name
-
-            print(f"Downloaded lecture file to temp path: {tmp_path}")
-
-            # Extract text from the downloaded file
-            text = extract_text_from_file(tmp_path)
-            combined_text += text + "\n"
-
-            # Optionally delete the temp file
-            os.remove(tmp_path)
-
-        except Exception as e:
-            print(f"Error processing file {url}: {e}")
-            continue
-
-    if not combined_text.strip():
-        return {"response": "No text could be extracted from the provided files."}
-
-    # Preprocess the extracted text
-    preprocessed_text = preprocess_text(combined_text)
-
+def build_chat_prompt(request, preprocessed_text):
     # Format conversation history
     conversation_context = ""
     for msg in request.conversation_history:
@@ -368,7 +242,7 @@ async def chat_with_lecture(request: ChatRequest):
         conversation_context += f"{role}: {content}\n"
 
     # Combine the custom prompt with extracted content and conversation history
-    full_prompt = (
+    return (
         "You are an expert educational assistant that helps students understand lecture content through conversation. "
         "You have access to the lecture material and can answer questions, explain concepts, and provide additional context.\n\n"
         "Guidelines for the conversation:\n"
@@ -383,12 +257,131 @@ async def chat_with_lecture(request: ChatRequest):
         "Your response:"
     )
 
+@summarization_router.post("/generate_summarization")
+async def generate_summarization(request: SummarizationRequest):
+    print("Summarization request received at backend", request)
+
+    # Downloads and PDF parsing run off the event loop
+    combined_text = await run_in_threadpool(extract_lecture_text, request.lecture_urls)
+
+    if not combined_text.strip():
+        return {"summary": NO_TEXT_MESSAGE}
+
+    # print("Text extracted from the uploaded files", text)
+
+    # Preprocess the extracted text
+    preprocessed_text = preprocess_text(combined_text)
+    # print("Preprocessed text", preprocessed_text)
+
+    # Combine the custom prompt with extracted content
+    full_prompt = build_summarization_prompt(request, preprocessed_text)
+
+    # Generate the summary using the user-defined prompt
+    summary = await query_openrouter_api(full_prompt, model="meta-llama/llama-4-maverick:free")
+    print("Summary generated", summary)
+
+    # Add guardrails for the summary
+    if not summary or len(summary.strip()) < 50:
+        return {"summary": SUMMARY_TOO_SHORT_MESSAGE}
+
+    return {"summary": summary}
+
+@summarization_router.post("/generate_flashcards")
+async def generate_flashcards(request: FlashcardsRequest):
+    print("Flashcards request received at backend", request)
+
+    # Downloads and PDF parsing run off the event loop
+    combined_text = await run_in_threadpool(extract_lecture_text, request.lecture_urls)
+
+    if not combined_text.strip():
+        return {"flashcards": NO_TEXT_MESSAGE}
+
+    # Preprocess the extracted text
+    preprocessed_text = preprocess_text(combined_text)
+    print("Preprocessed text", preprocessed_text)
+
+    # Combine the custom prompt with extracted content
+    full_prompt = build_flashcards_prompt(request, preprocessed_text)
+
+    # Generate the flashcards using the user-defined prompt
+    flashcards = await query_openrouter_api(full_prompt, model="meta-llama/llama-4-maverick:free")
+    print("Flashcards generated", flashcards)
+
+    # Add guardrails for the flashcards
+    if not flashcards or len(flashcards.strip()) < 50:
+        return {"flashcards": FLASHCARDS_TOO_SHORT_MESSAGE}
+
+    return {"flashcards": flashcards}
+
+@summarization_router.post("/chat_with_lecture")
+async def chat_with_lecture(request: ChatRequest):
+    print("Chat request received at backend", request)
+
+    # Downloads and PDF parsing run off the event loop
+    combined_text = await run_in_threadpool(extract_lecture_text, request.lecture_urls)
+
+    if not combined_text.strip():
+        return {"response": NO_TEXT_MESSAGE}
+
+    # Preprocess the extracted text
+    preprocessed_text = preprocess_text(combined_text)
+
+    full_prompt = build_chat_prompt(request, preprocessed_text)
+
     # Generate the response using the user's message and conversation history
-    response = query_openrouter_api(full_prompt, model="meta-llama/llama-4-maverick:free")
+    response = await query_openrouter_api(full_prompt, model="meta-llama/llama-4-maverick:free")
     print("Response generated", response)
 
     if not response or len(response.strip()) < 10:
-        return {"response": "I apologize, but I couldn't generate a meaningful response. Please try rephrasing your question."}
+        return {"response": CHAT_FALLBACK_MESSAGE}
 
     return {"response": response}
 
+# Streaming variants: the same prompts and guardrails, sent as server-sent events.
+# Clients get `progress` events, a `token` event per generated text delta, then one `result`
+# event with the same body as the non-streaming endpoint (or an `error` event).
+async def stream_lecture_completion(lecture_urls, build_prompt, result_key, min_length, too_short_message,
+                                    model="meta-llama/llama-4-maverick:free"):
+    yield "progress", {"stage": "extracting"}
+    combined_text = await run_in_threadpool(extract_lecture_text, lecture_urls)
+    if not combined_text.strip():
+        yield "result", {result_key: NO_TEXT_MESSAGE}
+        return
+
+    yield "progress", {"stage": "generating"}
+    prompt = build_prompt(preprocess_text(combined_text))
+    output = llm_cache.get(model, prompt)
+    if output is not None:
+        yield "token", {"text": output}
+    else:
+        parts = []
+        async for text in astream_chat_completion(prompt, model, API_TOKEN, url=API_URL):
+            parts.append(text)
+            yield "token", {"text": text}
+        output = "".join(parts)
+        llm_cache.put(model, prompt, output)
+
+    if len(output.strip()) < min_length:
+        output = too_short_message
+    yield "result", {result_key: output}
+
+@summarization_router.post("/generate_summarization/stream")
+async def stream_summarization(request: SummarizationRequest):
+    return sse_response(stream_lecture_completion(
+        request.lecture_urls, lambda text: build_summarization_prompt(request, text),
+        "summary", 50, SUMMARY_TOO_SHORT_MESSAGE
+    ))
+
+@summarization_router.post("/generate_flashcards/stream")
+async def stream_flashcards(request: FlashcardsRequest):
+    return sse_response(stream_lecture_completion(
+        request.lecture_urls, lambda text: build_flashcards_prompt(request, text),
+        "flashcards", 50, FLASHCARDS_TOO_SHORT_MESSAGE
+    ))
+
+@summarization_router.post("/chat_with_lecture/stream")
+async def stream_chat_with_lecture(request: ChatRequest):
+    return sse_response(stream_lecture_completion(
+        request.lecture_urls, lambda text: build_chat_prompt(request, text),
+        "response", 10, CHAT_FALLBACK_MESSAGE
+    ))
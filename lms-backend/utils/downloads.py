@@ -0,0 +1,67 @@
+from typing import BinaryIO, Optional
+import os
+import tempfile
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MB
+MAX_DOWNLOAD_BYTES = int(float(os.getenv("MAX_DOWNLOAD_MB", "200")) * (1 << 20))
+DOWNLOAD_TIMEOUT = (5, float(os.getenv("DOWNLOAD_READ_TIMEOUT", "60")))  # (connect, read) seconds
+
+class DownloadTooLargeError(Exception):
+    """Raised when a download is larger than the configured limit"""
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """Process-wide keep-alive session so repeated downloads reuse pooled connections"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=8,
+                    pool_maxsize=int(os.getenv("DOWNLOAD_POOL_SIZE", "16")),
+                    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def download_to_file(url: str, file_obj: BinaryIO, max_bytes: Optional[int] = None) -> int:
+    """
+    Stream url into file_obj in 1 MB chunks and return the number of bytes written.
+    Aborts before reading the body if Content-Length is over max_bytes, and mid-stream
+    if the server sends more than it announced.
+    """
+    max_bytes = max_bytes or MAX_DOWNLOAD_BYTES
+    with get_http_session().get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        content_length = response.headers.get("Content-Length")
+        if content_length and int(content_length) > max_bytes:
+            raise DownloadTooLargeError(f"File is {int(content_length)} bytes, limit is {max_bytes}")
+
+        written = 0
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            if written > max_bytes:
+                raise DownloadTooLargeError(f"File exceeded the {max_bytes} byte limit while downloading")
+            file_obj.write(chunk)
+    return written
+
+def download_to_tempfile(url: str, suffix: str = "", max_bytes: Optional[int] = None, dir: Optional[str] = None) -> str:
+    """Stream url into a named temporary file and return its path; the caller removes it"""
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=dir, delete=False) as temp_file:
+        temp_file_path = temp_file.name
+        try:
+            download_to_file(url, temp_file, max_bytes=max_bytes)
+        except Exception:
+            temp_file.close()
+            os.unlink(temp_file_path)
+            raise
+    return temp_file_path
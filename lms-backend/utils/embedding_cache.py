@@ -0,0 +1,162 @@
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache backed by SQLite.
+    Rows are keyed by (model name, SHA-256 of the text) and hold the raw float32 bytes.
+    Once max_entries is exceeded the least recently used rows are evicted, down to 90% of
+    max_entries so that a full cache doesn't evict (and recount) on every write.
+    Hits refresh last_used in memory; the timestamps are written at most every touch_interval
+    seconds (or before an eviction), so lookups don't each commit a write.
+    SQLite errors are logged and treated as misses: the cache never fails an encode.
+    """
+    def __init__(self, path: str, max_entries: int = 200_000, touch_interval: float = 60.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.lock = threading.Lock()
+        self.pending_touches: Dict[Tuple[str, str], float] = {}
+        self.last_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.conn.commit()
+        # Upper bound on the row count: writes add to it, and only crossing max_entries triggers a real COUNT(*)
+        self.approx_entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[str, np.ndarray]:
+        """Return {text_hash: vector} for the texts that are cached"""
+        hashes = list(dict.fromkeys(self.text_hash(text) for text in texts))
+        found = {}
+        with self.lock:
+            try:
+                # SQLite caps bound parameters, so look hashes up in slices
+                for start in range(0, len(hashes), 500):
+                    batch = hashes[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self.conn.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                        [model, *batch]
+                    ).fetchall()
+                    for text_hash, vector in rows:
+                        found[text_hash] = np.frombuffer(vector, dtype=np.float32)
+                now = time.time()
+                self.pending_touches.update({(model, text_hash): now for text_hash in found})
+                if time.monotonic() - self.last_flush >= self.touch_interval:
+                    self._flush_touches()
+                    self.conn.commit()
+            except sqlite3.Error as e:
+                self._rollback()
+                print(f"embedding cache lookup failed, encoding without it: {e}")
+                found = {}
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray):
+        """Store vectors for texts, evicting the least recently used rows if the cache is full"""
+        now = time.time()
+        rows = [
+            (model, self.text_hash(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self.lock:
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                # Replaced rows and other processes' writes make this an estimate
+                self.approx_entries += len(rows)
+                if self.approx_entries > self.max_entries:
+                    count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                    overflow = count - self.max_entries * 9 // 10 if count > self.max_entries else 0
+                    if overflow > 0:
+                        # Recent hits must be on disk before picking the least recently used rows
+                        self._flush_touches()
+                        self.conn.execute(
+                            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                            (overflow,)
+                        )
+                        self.evictions += overflow
+                    self.approx_entries = count - overflow
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self._rollback()
+                print(f"embedding cache write failed, skipping {len(rows)} vectors: {e}")
+
+    def _flush_touches(self):
+        """Write buffered last_used timestamps (caller holds the lock and commits)"""
+        self.last_flush = time.monotonic()
+        if not self.pending_touches:
+            return
+        touches, self.pending_touches = self.pending_touches, {}
+        self.conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+            [(used, model, text_hash) for (model, text_hash), used in touches.items()]
+        )
+
+    def _rollback(self):
+        try:
+            self.conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> Dict:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Shared cache for this process, or None when EMBEDDING_CACHE_PATH is set to an empty string"""
+    global _cache
+    path = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+    if not path:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    path,
+                    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000")),
+                    touch_interval=float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL", "60"))
+                )
+    return _cache
@@ -0,0 +1,102 @@
+from typing import Dict, Iterable, List
+import threading
+import time
+import numpy as np
+from sentence_transformers import CrossEncoder, SentenceTransformer
+from .embedding_cache import get_embedding_cache
+
+DEFAULT_EMBEDDING_MODEL = 'thenlper/gte-base'
+DEFAULT_CROSS_ENCODER = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+# One instance per model name, shared by ingestion, retrieval and generation
+_models: Dict[str, SentenceTransformer] = {}
+_cross_encoders: Dict[str, CrossEncoder] = {}
+_models_lock = threading.Lock()
+
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL) -> SentenceTransformer:
+    """Return the shared SentenceTransformer for model_name, loading it on first use"""
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        # Another thread may have finished loading while we waited for the lock
+        model = _models.get(model_name)
+        if model is None:
+            print("loading embedding model", model_name)
+            model = SentenceTransformer(model_name)
+            _models[model_name] = model
+    return model
+
+def get_cross_encoder(model_name: str = DEFAULT_CROSS_ENCODER) -> CrossEncoder:
+    """Return the shared CrossEncoder reranker for model_name, loading it on first use"""
+    model = _cross_encoders.get(model_name)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        model = _cross_encoders.get(model_name)
+        if model is None:
+            print("loading cross encoder", model_name)
+            model = CrossEncoder(model_name)
+            _cross_encoders[model_name] = model
+    return model
+
+def warm_up_embedding_models(model_names: Iterable[str] = (DEFAULT_EMBEDDING_MODEL,)) -> None:
+    """Load models ahead of the first request (called from the app startup hook)"""
+    for model_name in model_names:
+        get_embedding_model(model_name)
+
+def loaded_embedding_models() -> Dict[str, SentenceTransformer]:
+    """Snapshot of the models currently resident in this process"""
+    return dict(_models)
+
+def encode_texts(
+    texts: List[str],
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    batch_size: int = 32,
+    use_cache: bool = True
+) -> np.ndarray:
+    """
+    Embed texts through the persistent embedding cache.
+    Cache misses are encoded in length-sorted mini-batches; rows of the returned
+    contiguous (len(texts), dim) float32 array follow the original order of `texts`.
+    """
+    model = get_embedding_model(model_name)
+    embeddings = np.empty((len(texts), model.get_sentence_embedding_dimension()), dtype=np.float32)
+    if not texts:
+        return embeddings
+
+    cache = get_embedding_cache() if use_cache else None
+    cached = cache.get_many(model_name, texts) if cache else {}
+    missing: List[int] = []
+    for i, text in enumerate(texts):
+        vector = cached.get(cache.text_hash(text)) if cache else None
+        if vector is None:
+            missing.append(i)
+        else:
+            embeddings[i] = vector
+    if not missing:
+        return embeddings
+
+    order = sorted(missing, key=lambda i: len(texts[i]))
+    start_time = time.perf_counter()
+    for start in range(0, len(order), batch_size):
+        batch_ids = order[start:start + batch_size]
+        embeddings[batch_ids] = model.encode(
+            [texts[i] for i in batch_ids],
+            batch_size=len(batch_ids),
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+    elapsed = time.perf_counter() - start_time
+    print(f"embedded {len(missing)} texts in {elapsed:.2f}s ({len(missing) / max(elapsed, 1e-9):.1f} texts/sec, "
+          f"batch size {batch_size}, {len(texts) - len(missing)} cache hits)")
+
+    if cache:
+        cache.put_many(model_name, [texts[i] for i in missing], embeddings[missing])
+    return embeddings
+
+def encode_text(text: str, model_name: str = DEFAULT_EMBEDDING_MODEL, use_cache: bool = True) -> np.ndarray:
+    """Embed a single text, e.g. a search query"""
+    return encode_texts([text], model_name=model_name, use_cache=use_cache)[0]
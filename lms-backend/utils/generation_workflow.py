@@ -1,32 +1,112 @@
+import os
 import re
 import ast
 import json
 import base64
+import time
 import nbformat
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from io import BytesIO
-import requests
-from openai import OpenAI
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import LETTER
 from reportlab.lib.units import inch
-from typing import List, Optional
+from typing import Any, Callable, Iterator, List, Optional, Tuple
 from database.retriever import Retriever
 from reportlab.lib.pagesizes import LETTER
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
-from sentence_transformers import SentenceTransformer
+from langgraph.types import StreamWriter
 from models.generation_model import AssignmentState, PracticeQAState
 from nbformat.v4 import new_notebook, new_code_cell, new_markdown_cell
+from .embedding_models import encode_text
+from .llm_cache import llm_cache
+from .llm_client import get_openrouter_client, together_completion
 from .prompts import getmetaprompt, getgenerationprompt, getquizverificationprompt, getgenerationwithfeedbackprompt, getragoptimizationprompt, QUIZ_COMPONENT_WEIGHTAGES
 
-# Initialize embedding model
-embedding_model = SentenceTransformer('thenlper/gte-base')
-
-def query_openrouter(prompt: str, api_key: str, max_length: int = 500, model: str = "meta-llama/llama-4-maverick:free") -> str:
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key
+# Shared by every workflow run; Retriever uses the process-wide pooled Supabase client
+retriever = Retriever()
+
+# Over-fetch-and-rerank retrieval for lecture context, bounded by a per-request latency budget
+RETRIEVAL_CASCADE = os.getenv("RETRIEVAL_CASCADE", "false").lower() in ("1", "true", "yes")
+RETRIEVAL_LATENCY_BUDGET_MS = float(os.getenv("RETRIEVAL_LATENCY_BUDGET_MS", "1500"))
+RETRIEVAL_CROSS_ENCODER = os.getenv("RETRIEVAL_CROSS_ENCODER", "false").lower() in ("1", "true", "yes")
+
+# Search with the raw prompt while the query-optimization LLM call runs, instead of after it
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() in ("1", "true", "yes")
+SPECULATIVE_RETRIEVAL_DEADLINE_MS = float(os.getenv("SPECULATIVE_RETRIEVAL_DEADLINE_MS", "3000"))
+# Runs only the optimization LLM calls: a call that misses its deadline keeps its worker until the
+# provider answers, so searches stay on the node's own thread and never queue behind them
+_optimization_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SPECULATIVE_RETRIEVAL_WORKERS", "8")), thread_name_prefix="query-optimization"
+)
+
+def search_lecture_chunks(query_text: str, query_embedding: List[float], relevant_doc_ids: List[int], limit_rows: int = 10):
+    if RETRIEVAL_CASCADE:
+        return retriever.cascade_search(
+            query_text=query_text,
+            query_embedding=query_embedding,
+            relevant_doc_ids=relevant_doc_ids,
+            limit_rows=limit_rows,
+            latency_budget_ms=RETRIEVAL_LATENCY_BUDGET_MS,
+            use_cross_encoder=RETRIEVAL_CROSS_ENCODER
+        )
+    return retriever.filtered_hybrid_search(
+        query_text=query_text,
+        query_embedding=query_embedding,
+        relevant_doc_ids=relevant_doc_ids,
+        limit_rows=limit_rows
     )
-    completion = client.chat.completions.create(
+
+def search_context(query_text: str, urls: Optional[List[str]], limit_rows: int = 10) -> Optional[List[tuple]]:
+    """
+    Chunks for query_text, restricted to the lecture files when urls are given, as
+    (id, content, embedding_id, similarity, ...) tuples. None when the urls match no documents.
+    """
+    query_embedding = encode_text(query_text).tolist()
+    if urls:
+        relevant_doc_ids = retriever.get_document_ids_by_urls(urls)
+        if not relevant_doc_ids:
+            return None
+        return search_lecture_chunks(query_text, query_embedding, relevant_doc_ids, limit_rows=limit_rows)
+    return retriever.hybrid_search(query_text=query_text, query_embedding=query_embedding, limit_rows=limit_rows)
+
+def query_openrouter(prompt: str, api_key: str, max_length: int = 500, model: str = "meta-llama/llama-4-maverick:free",
+                     on_token: Optional[Callable[[str], None]] = None, cache: bool = True,
+                     semantic_key: Optional[str] = None) -> str:
+    """
+    Chat completion through OpenRouter, served from llm_cache when the same prompt was answered
+    recently. Pass cache=False for steps whose output must be fresh; semantic_key (the variable
+    part of the prompt) lets near-identical requests share a cached answer.
+    """
+    if cache:
+        cached = llm_cache.get(model, prompt, semantic_key=semantic_key)
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached)
+            return cached
+    response = _complete_openrouter(prompt, api_key, model, on_token)
+    if cache:
+        llm_cache.put(model, prompt, response, semantic_key=semantic_key)
+    return response
+
+def _complete_openrouter(prompt: str, api_key: str, model: str, on_token: Optional[Callable[[str], None]]) -> str:
+    if on_token is not None:
+        # Streamed: each text delta is handed to on_token as it arrives, the full text is returned
+        stream = get_openrouter_client(api_key).chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True
+        )
+        parts = []
+        for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                parts.append(text)
+                on_token(text)
+        return "".join(parts)
+
+    # Pooled client: repeated calls reuse the same keep-alive connections
+    completion = get_openrouter_client(api_key).chat.completions.create(
         model=model,
         messages=[{"role": "user", "content": prompt}]
     )
@@ -39,19 +119,7 @@ def query_openrouter(prompt: str, api_key: str, max_length: int = 500, model: st
 
 def query_together(prompt:str, api_key: str, max_length: int = 500, model_name: str = "muhammadahmad1/test-lora-model-creation-8b") -> str:
     # Step 1: Submit the inference job
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
-    payload = {
-    "model": model_name,
-    "prompt": prompt,
-    "temperature": 0.8,
-    "max_tokens": max_length
-}
-
-    response = requests.post("https://api.together.xyz/v1/completions", headers=headers, json=payload)
+    response = together_completion(prompt, api_key, model_name, max_tokens=max_length, temperature=0.8)
 
     if response.status_code != 200:
         raise Exception(f"Error receiving response: {response.status_code}, {response.text}")
@@ -97,39 +165,86 @@ def extract_notebook_from_json(json_notebook_str):
 
     return "\n".join(extracted_parts).strip()
 
-def retrieval_node(state: AssignmentState, api_key: str) -> AssignmentState:
+def _configurable(config: RunnableConfig, key: str, default=None):
+    """Per-run option passed to graph.invoke(..., config={"configurable": {...}})"""
+    return (config or {}).get("configurable", {}).get(key, default)
+
+def _token_callback(config: RunnableConfig, writer: StreamWriter, node: str) -> Optional[Callable[[str], None]]:
+    """Forward LLM text deltas to graph.stream(stream_mode="custom") when the run asked for tokens"""
+    if not _configurable(config, "stream_tokens", False):
+        return None
+    return lambda text: writer({"node": node, "text": text})
+
+def retrieval_node(state: AssignmentState, config: RunnableConfig) -> AssignmentState:
+    api_key = _configurable(config, "openrouter_api_key")
     raw_prompt = state['input_content']
     rag_query_optimization_system_prompt = getragoptimizationprompt()
     optimization_prompt = f"{rag_query_optimization_system_prompt}\n\nInput:\n{raw_prompt}\n\nOptimized Query:"
-    optimized_query = query_openrouter(optimization_prompt, api_key)
+    if SPECULATIVE_RETRIEVAL:
+        return speculative_retrieval(state, optimization_prompt, api_key)
+    # Near-identical requests get the same optimized query
+    optimized_query = query_openrouter(optimization_prompt, api_key, semantic_key=raw_prompt)
     print("Optimized Query:", optimized_query)
     return {**state, "optimized_query": optimized_query}
 
-def metaprompt_node(state: AssignmentState, api_key: str) -> AssignmentState:
+def speculative_retrieval(state: AssignmentState, optimization_prompt: str, api_key: str) -> AssignmentState:
+    """
+    Start searching with the raw prompt right away while the optimization LLM call runs.
+    If the optimized query arrives within SPECULATIVE_RETRIEVAL_DEADLINE_MS it is searched too
+    and both result sets are merged; otherwise the raw-prompt results are used as they are.
+    The prefetched chunks go to metaprompt_node through state['retrieved_chunks'].
+    """
+    raw_prompt = state['input_content']
+    urls = state.get('urls', None)
+    deadline = time.perf_counter() + SPECULATIVE_RETRIEVAL_DEADLINE_MS / 1000
+    optimization = _optimization_executor.submit(query_openrouter, optimization_prompt, api_key, semantic_key=raw_prompt)
+
+    # The node already runs off the event loop, so the raw-prompt search happens right here
+    try:
+        results = search_context(raw_prompt, urls)
+    except Exception as e:
+        print(f"Speculative retrieval failed: {e}")
+        results = None
+
+    try:
+        optimized_query = optimization.result(timeout=max(0.0, deadline - time.perf_counter()))
+    except FutureTimeoutError:
+        # The call finishes in the background (and lands in the LLM cache); this run keeps the raw-prompt results
+        print("Optimized query missed the speculative retrieval deadline")
+        return {**state, "optimized_query": raw_prompt, "retrieved_chunks": results}
+    print("Optimized Query:", optimized_query)
+
+    if results is not None and optimized_query and optimized_query != raw_prompt:
+        try:
+            optimized_results = search_context(optimized_query, urls)
+            results = retriever.merge_results([results, optimized_results or []])[:10]
+        except Exception as e:
+            print(f"Retriever error: {e}")
+    return {**state, "optimized_query": optimized_query, "retrieved_chunks": results}
+
+def metaprompt_node(state: AssignmentState, config: RunnableConfig) -> AssignmentState:
+    api_key = _configurable(config, "openrouter_api_key")
     raw_prompt = state['input_content']
     optimized_query = state.get('optimized_query', raw_prompt)  # Fallback to raw_prompt if optimized_query is missing
     urls = state.get('urls', None)
 
-    # Initialize retriever
-    retriever = Retriever()
+    prefetched = state.get('retrieved_chunks')
 
-    # Generate embedding for optimized_query
-    query_embedding = embedding_model.encode(optimized_query).tolist()
+    # Generate embedding for optimized_query (not needed when chunks were prefetched)
+    query_embedding = encode_text(optimized_query).tolist() if prefetched is None else None
 
     # Fetch context using retriever
     context = ""
     try:
-        if urls:
+        if prefetched is not None:
+            # Already retrieved speculatively, alongside query optimization
+            context = "\n".join(r[1].encode('utf-8', errors='replace').decode('utf-8') for r in prefetched)
+        elif urls:
             # Get document IDs from URLs
             relevant_doc_ids = retriever.get_document_ids_by_urls(urls)
             if relevant_doc_ids:
                 # Use filtered hybrid search to get relevant chunks
-                results = retriever.filtered_hybrid_search(
-                    query_text=optimized_query,
-                    query_embedding=query_embedding,
-                    relevant_doc_ids=relevant_doc_ids,
-                    limit_rows= 10
-                )
+                results = search_lecture_chunks(optimized_query, query_embedding, relevant_doc_ids)
                 if len(results) == 0:
                     print("no relevant chunk found from the docs")
                 else:
@@ -177,22 +292,27 @@ def metaprompt_node(state: AssignmentState, api_key: str) -> AssignmentState:
         return {**state, "assignment": output, "status": "failed"}
     return {**state, "assignment": output, "status": "pending", "attempts": 0}
 
-def generate_assignment_node(state: AssignmentState, api_key: str) -> AssignmentState:
+def generate_assignment_node(state: AssignmentState, config: RunnableConfig, writer: StreamWriter) -> AssignmentState:
+    api_key = _configurable(config, "openrouter_api_key")
+    on_token = _token_callback(config, writer, "generate_assignment")
     prompt = state["assignment"]
     feedback = state['human_feedback']
     if feedback == '':
         gen_prompt = getgenerationprompt(prompt, state['option'])
-        assignment = query_openrouter(gen_prompt, api_key)
+        assignment = query_openrouter(gen_prompt, api_key, on_token=on_token)
     else:
         assignment_prev_version = extract_notebook_from_json(state['assignment_prev_version'])
         gen_wfeedback_prompt = getgenerationwithfeedbackprompt(assignment_prev_version, feedback)
-        assignment = query_openrouter(gen_wfeedback_prompt, api_key)
+        # A revision request always gets a fresh draft
+        assignment = query_openrouter(gen_wfeedback_prompt, api_key, on_token=on_token, cache=False)
 
     state["assignment"] = assignment
     print("[ASSIGNMENT]========", assignment)
     return {**state, "assignment": assignment}
 
-def verify_assignment_node(state: AssignmentState, openrouter_api_key: str, together_api_key: str) -> AssignmentState:
+def verify_assignment_node(state: AssignmentState, config: RunnableConfig) -> AssignmentState:
+    openrouter_api_key = _configurable(config, "openrouter_api_key")
+    together_api_key = _configurable(config, "together_api_key")
     # if state['option'] == 'quiz':
     #     return {**state, "status": "verified"}
     if state['option'] == 'assignment':
@@ -222,7 +342,7 @@ def verify_assignment_node(state: AssignmentState, openrouter_api_key: str, toge
 
     except Exception as e:
         print("Error in query_together", e)
-        review = query_openrouter(critique_prompt, openrouter_api_key)
+        review = query_openrouter(critique_prompt, openrouter_api_key, cache=False)
     state['feedback'] = review
     score = extract_score(review)
     print('Last 3 Scores', state['scores'])
@@ -330,15 +450,27 @@ def convert_to_pdf_node(state: AssignmentState) -> AssignmentState:
 #     return state
 
 
-def generate_assignment_workflow(input_content: str, openrouter_api_key: str, together_api_key: str, assignmentorquiz: str, human_feedback:str, prev_version:str,  urls: Optional[List[str]] = None) -> dict:
-    print("enters function")
+def handle_verified_routing(state: AssignmentState) -> str:
+    if state["status"] == "verified":
+        return "convert_to_notebook" if state["option"] == "assignment" else "convert_to_pdf"
+    elif state["status"] == "pending":
+        return "generate_assignment"
+        # return "generate_assignment" if state["option"] == "quiz" else "human_feedback"
+    elif state["status"] == "awaiting_feedback":
+        return "convert_to_notebook"
+    else:
+        print("should-never-enter-this-part-of-workflow")
+        return END
+
+def build_assignment_graph():
+    """Compile the assignment/quiz graph; API keys arrive per run through config["configurable"]"""
     workflow = StateGraph(AssignmentState)
 
     # Nodes
-    workflow.add_node("retrieval", lambda s: retrieval_node(s, openrouter_api_key))
-    workflow.add_node("metaprompt", lambda s: metaprompt_node(s, openrouter_api_key))
-    workflow.add_node("generate_assignment", lambda s: generate_assignment_node(s, openrouter_api_key))
-    workflow.add_node("verify_assignment", lambda s: verify_assignment_node(s, openrouter_api_key,together_api_key))
+    workflow.add_node("retrieval", retrieval_node)
+    workflow.add_node("metaprompt", metaprompt_node)
+    workflow.add_node("generate_assignment", generate_assignment_node)
+    workflow.add_node("verify_assignment", verify_assignment_node)
     workflow.add_node("convert_to_notebook", convert_to_notebook_node)
     workflow.add_node("convert_to_pdf", convert_to_pdf_node)
     # workflow.add_node("human_feedback", wait_for_human_feedback)
@@ -358,18 +490,6 @@ def generate_assignment_workflow(input_content: str, openrouter_api_key: str, to
     workflow.add_edge("generate_assignment", "verify_assignment")
 
     # Conditional routing after verification
-    def handle_verified_routing(state):
-        if state["status"] == "verified":
-            return "convert_to_notebook" if state["option"] == "assignment" else "convert_to_pdf"
-        elif state["status"] == "pending":
-            return "generate_assignment"
-            # return "generate_assignment" if state["option"] == "quiz" else "human_feedback"
-        elif state["status"] == "awaiting_feedback":
-            return "convert_to_notebook"
-        else:
-            print("should-never-enter-this-part-of-workflow")
-            return END
-
     workflow.add_conditional_edges("verify_assignment", handle_verified_routing, {
         "convert_to_notebook": "convert_to_notebook",
         "convert_to_pdf": "convert_to_pdf",
@@ -380,7 +500,13 @@ def generate_assignment_workflow(input_content: str, openrouter_api_key: str, to
     workflow.add_edge("convert_to_notebook", END)
     workflow.add_edge("convert_to_pdf", END)
 
-    graph = workflow.compile()
+    return workflow.compile()
+
+# Compiled once at import and shared by every request
+assignment_graph = build_assignment_graph()
+
+def assignment_run(input_content: str, openrouter_api_key: str, together_api_key: str, assignmentorquiz: str, human_feedback: str, prev_version: str, urls: Optional[List[str]] = None) -> Tuple[dict, dict]:
+    """Initial state and per-run config for assignment_graph"""
     initial_state = {
         "input_content": input_content,
         "assignment": "",   #stores either assignment or quiz depending on api call
@@ -392,50 +518,30 @@ def generate_assignment_workflow(input_content: str, openrouter_api_key: str, to
         "scores": [],
         "optimized_query": "",
         "human_feedback" : human_feedback,
-        "assignment_prev_version" : prev_version
+        "assignment_prev_version" : prev_version,
+        "retrieved_chunks": None
     }
+    config = {"configurable": {"openrouter_api_key": openrouter_api_key, "together_api_key": together_api_key}}
+    return initial_state, config
 
-    # Generate Mermaid diagram
-    try:
-        mermaid_code = graph.get_graph().draw_mermaid()
-        with open("workflow_graph.mmd", "w", encoding="utf-8") as f:
-            f.write(mermaid_code)
-        print("Mermaid diagram saved as workflow_graph.mmd")
-        print("Render it at: https://mermaid.live/")
-        # print("\nMermaid Code:\n")
-        # print(mermaid_code)
-    except Exception as e:
-        print(f"Failed to generate Mermaid diagram: {e}")
-    
-    print("worflow compiles")
-
-    return graph.invoke(initial_state)
-
-
-
-
-
-
-
-
-
+def generate_assignment_workflow(input_content: str, openrouter_api_key: str, together_api_key: str, assignmentorquiz: str, human_feedback:str, prev_version:str,  urls: Optional[List[str]] = None) -> dict:
+    initial_state, config = assignment_run(input_content, openrouter_api_key, together_api_key, assignmentorquiz, human_feedback, prev_version, urls)
+    return assignment_graph.invoke(initial_state, config=config)
 
 
 ############ functions for generate practice Q/As workflow ####################
 
 
 
-def extract_prompt_node(state: PracticeQAState, api_key: str) -> dict:
+def extract_prompt_node(state: PracticeQAState, config: RunnableConfig) -> dict:
+    api_key = _configurable(config, "openrouter_api_key")
 
     raw_prompt = state['input_content']
     optimized_query = state.get('optimized_query', raw_prompt)  # Fallback to raw_prompt if optimized_query is missing
     urls = state.get('urls', None)
 
-    # Initialize retriever
-    retriever = Retriever()
-
     # Generate embedding for optimized_query
-    query_embedding = embedding_model.encode(optimized_query).tolist()
+    query_embedding = encode_text(optimized_query).tolist()
 
     # Fetch context using retriever
     context = ""
@@ -445,12 +551,7 @@ def extract_prompt_node(state: PracticeQAState, api_key: str) -> dict:
             relevant_doc_ids = retriever.get_document_ids_by_urls(urls)
             if relevant_doc_ids:
                 # Use filtered hybrid search to get relevant chunks
-                results = retriever.filtered_hybrid_search(
-                    query_text=optimized_query,
-                    query_embedding=query_embedding,
-                    relevant_doc_ids=relevant_doc_ids,
-                    limit_rows= 10
-                )
+                results = search_lecture_chunks(optimized_query, query_embedding, relevant_doc_ids)
                 if len(results) == 0:
                     print("no relevant chunk found from the docs")
                 else:
@@ -500,52 +601,63 @@ def extract_prompt_node(state: PracticeQAState, api_key: str) -> dict:
     return {**state, "practiceqas": output, "status": "valid"}
 
 
-def retrieval_qa_node(state: PracticeQAState, api_key: str) -> PracticeQAState:
+def retrieval_qa_node(state: PracticeQAState, config: RunnableConfig) -> PracticeQAState:
+    api_key = _configurable(config, "openrouter_api_key")
     raw_prompt = state['input_content']
     rag_query_optimization_system_prompt = getragoptimizationprompt()
     optimization_prompt = f"{rag_query_optimization_system_prompt}\n\nInput:\n{raw_prompt}\n\nOptimized Query:"
-    optimized_query = query_openrouter(optimization_prompt, api_key)
+    # Near-identical requests get the same optimized query
+    optimized_query = query_openrouter(optimization_prompt, api_key, semantic_key=raw_prompt)
     print("Optimized Query:", optimized_query)
     return {**state, "optimized_query": optimized_query}
 
 
-def generate_practice_qa_node(state: PracticeQAState, api_key: str) -> dict:
+def generate_practice_qa_node(state: PracticeQAState, config: RunnableConfig, writer: StreamWriter) -> dict:
+    api_key = _configurable(config, "openrouter_api_key")
+    on_token = _token_callback(config, writer, "generate_qa")
     print("gen----")
     prompt = state["practiceqas"]
     print("FINALPROMPT-FOR-PRACTICE-QA",prompt)
     gen_prompt = getgenerationprompt(prompt, 'practice')
     gen_prompt += f' All the generated questions MUST meet this difficulty level: {state["difficulty"].upper()}.'
     print(gen_prompt)
-    result = query_openrouter(gen_prompt, api_key)
+    result = query_openrouter(gen_prompt, api_key, on_token=on_token)
 
     state["practiceqas"] = result
     print("[PRACTICE-Q-A-s]========", result)
     return {**state, "practiceqas": result}
 
-def generate_practice_qa_workflow(input_content: str, openrouter_api_key: str, difficulty: str, urls: Optional[List[str]] = None) -> dict:
+def route_valid_practice_prompt(state: PracticeQAState) -> str:
+    if state["status"] == "invalid":
+        return END
+    # Lecture-grounded requests go through retrieval first
+    return "retrieval" if state.get("urls") else "generate_qa"
+
+def build_practice_qa_graph():
+    """Compile the practice Q/A graph; API keys arrive per run through config["configurable"]"""
     workflow = StateGraph(PracticeQAState)
 
     # Nodes
-    workflow.add_node("extract_contextualized_prompt", lambda s: extract_prompt_node(s, openrouter_api_key))
-    workflow.add_node("retrieval", lambda s: retrieval_qa_node(s, openrouter_api_key))
-    workflow.add_node("generate_qa", lambda s: generate_practice_qa_node(s, openrouter_api_key))
-
-    is_lec_urls = urls is not None and len(urls) > 0
+    workflow.add_node("extract_contextualized_prompt", extract_prompt_node)
+    workflow.add_node("retrieval", retrieval_qa_node)
+    workflow.add_node("generate_qa", generate_practice_qa_node)
 
     # Edges
     workflow.add_edge(START, "extract_contextualized_prompt")
-    workflow.add_conditional_edges("extract_contextualized_prompt", lambda s: s["status"], {
-        "invalid": END,
-        "valid": "retrieval" if is_lec_urls else "generate_qa"
+    workflow.add_conditional_edges("extract_contextualized_prompt", route_valid_practice_prompt, {
+        END: END,
+        "retrieval": "retrieval",
+        "generate_qa": "generate_qa"
     })
-
-    if is_lec_urls:
-        workflow.add_edge("retrieval", "generate_qa")
-
+    workflow.add_edge("retrieval", "generate_qa")
     workflow.add_edge("generate_qa", END)
 
-    graph = workflow.compile()
+    return workflow.compile()
+
+practice_qa_graph = build_practice_qa_graph()
 
+def practice_qa_run(input_content: str, openrouter_api_key: str, difficulty: str, urls: Optional[List[str]] = None) -> Tuple[dict, dict]:
+    """Initial state and per-run config for practice_qa_graph"""
     initial_state = {
         "input_content": input_content,
         "urls": urls,
@@ -555,15 +667,61 @@ def generate_practice_qa_workflow(input_content: str, openrouter_api_key: str, d
         "optimized_query" : "",
         "practiceqas": ""
     }
+    return initial_state, {"configurable": {"openrouter_api_key": openrouter_api_key}}
 
-    # try:
-    #     mermaid_code = graph.get_graph().draw_mermaid()
-    #     with open("practice_qa_graph.mmd", "w", encoding="utf-8") as f:
-    #         f.write(mermaid_code)
-    #     print("Mermaid diagram saved as practice_qa_graph.mmd")
-    #     print("Render it at: https://mermaid.live/")
-    # except Exception as e:
-    #     print(f"Failed to generate Mermaid diagram: {e}")
-
-    return graph.invoke(initial_state)
-
+def generate_practice_qa_workflow(input_content: str, openrouter_api_key: str, difficulty: str, urls: Optional[List[str]] = None) -> dict:
+    initial_state, config = practice_qa_run(input_content, openrouter_api_key, difficulty, urls)
+    return practice_qa_graph.invoke(initial_state, config=config)
+
+def progress_event(node: str, state: dict) -> dict:
+    """What a client needs to know after a node finishes (stage, draft number, score)"""
+    event = {"node": node, "status": state.get("status")}
+    if node == "retrieval" and state.get("optimized_query"):
+        event["optimized_query"] = state["optimized_query"]
+    elif node == "generate_assignment":
+        event["draft"] = state.get("attempts", 0) + 1
+    elif node == "verify_assignment" and state.get("scores"):
+        event["score"] = state["scores"][-1]
+        event["attempt"] = state.get("attempts", 0)
+    return event
+
+def stream_graph(graph, initial_state: dict, config: dict) -> Iterator[Tuple[str, Any]]:
+    """
+    Run a compiled graph, yielding ("progress", ...) after each node, ("token", ...) for each
+    streamed text delta and finally ("done", final state).
+    """
+    config = {**config, "configurable": {**config.get("configurable", {}), "stream_tokens": True}}
+    final_state = initial_state
+    for mode, chunk in graph.stream(initial_state, config=config, stream_mode=["updates", "custom", "values"]):
+        if mode == "custom":
+            yield "token", chunk
+        elif mode == "updates":
+            for node, update in chunk.items():
+                yield "progress", progress_event(node, update or {})
+        else:
+            final_state = chunk
+    yield "done", final_state
+
+def stream_assignment_workflow(*args, **kwargs) -> Iterator[Tuple[str, Any]]:
+    """generate_assignment_workflow as a stream of progress/token events (same arguments)"""
+    return stream_graph(assignment_graph, *assignment_run(*args, **kwargs))
+
+def stream_practice_qa_workflow(*args, **kwargs) -> Iterator[Tuple[str, Any]]:
+    """generate_practice_qa_workflow as a stream of progress/token events (same arguments)"""
+    return stream_graph(practice_qa_graph, *practice_qa_run(*args, **kwargs))
+
+def export_mermaid_diagrams(output_dir: str = ".") -> List[str]:
+    """Write both graphs as Mermaid files (render at https://mermaid.live/); returns the paths written"""
+    paths = []
+    for name, graph in (("workflow_graph.mmd", assignment_graph), ("practice_qa_graph.mmd", practice_qa_graph)):
+        path = os.path.join(output_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(graph.get_graph().draw_mermaid())
+        paths.append(path)
+    return paths
+
+if __name__ == "__main__":
+    # python -m utils.generation_workflow [output_dir]
+    import sys
+    for path in export_mermaid_diagrams(sys.argv[1] if len(sys.argv) > 1 else "."):
+        print("Mermaid diagram saved as", path)
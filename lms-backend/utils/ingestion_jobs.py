@@ -0,0 +1,94 @@
+from typing import Callable, Dict, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import os
+import threading
+import traceback
+import uuid
+
+class IngestionQueueFullError(Exception):
+    """Raised when the number of queued and running jobs has hit the limit"""
+
+class IngestionJobQueue:
+    """
+    Bounded worker pool for file ingestion.
+    Jobs run outside the event loop; their status and progress counters
+    (pages parsed, chunks embedded, rows written) can be polled by job id.
+    """
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, max_history: int = 500):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self.jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.active = 0
+
+    def submit(self, fn: Callable[..., Dict], **kwargs) -> str:
+        """
+        Queue fn(progress=..., **kwargs) and return its job id.
+        `progress(key, value)` updates the job's progress counters.
+        """
+        with self.lock:
+            if self.active >= self.max_pending:
+                raise IngestionQueueFullError(f"{self.active} ingestion jobs already pending")
+            self.active += 1
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "started_at": None,
+                "finished_at": None,
+                "progress": {"pages_parsed": 0, "chunks_embedded": 0, "rows_written": 0},
+                "result": None,
+                "error": None,
+            }
+            self._prune()
+
+        self.executor.submit(self._run, job_id, fn, kwargs)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return a copy of the job's current state, or None if unknown"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return {**job, "progress": dict(job["progress"])}
+
+    def _run(self, job_id: str, fn: Callable[..., Dict], kwargs: Dict):
+        job = self.jobs[job_id]
+
+        def progress(key: str, value: int):
+            with self.lock:
+                job["progress"][key] = value
+
+        with self.lock:
+            job["status"] = "running"
+            job["started_at"] = datetime.now(timezone.utc).isoformat()
+        try:
+            result = fn(progress=progress, **kwargs)
+            with self.lock:
+                job["status"] = "completed"
+                job["result"] = result
+        except Exception as e:
+            traceback.print_exc()
+            with self.lock:
+                job["status"] = "failed"
+                job["error"] = str(e)
+        finally:
+            with self.lock:
+                job["finished_at"] = datetime.now(timezone.utc).isoformat()
+                self.active -= 1
+
+    def _prune(self):
+        # Drop the oldest finished jobs once the history is full; caller holds the lock
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in ("completed", "failed")]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_history)]:
+            del self.jobs[job_id]
+
+ingestion_queue = IngestionJobQueue(
+    max_workers=int(os.getenv("INGESTION_WORKERS", "2")),
+    max_pending=int(os.getenv("INGESTION_MAX_PENDING", "16"))
+)
@@ -0,0 +1,130 @@
+from typing import Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+from .embedding_models import encode_text
+
+class LLMResponseCache:
+    """
+    Bounded LRU cache of LLM responses with a time-to-live.
+
+    The exact tier is keyed on a hash of (model, prompt, params). Call sites can also pass a
+    semantic_key, the variable part of a templated prompt such as the user's raw request.
+    Another call with the same template (the prompt with semantic_key removed), model and
+    params whose semantic_key embeds within semantic_threshold cosine similarity is then served
+    from the cache. Embedding only the variable part keeps long shared instructions from
+    making every request look alike. The semantic tier is off when semantic_threshold is None.
+    """
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600.0, semantic_threshold: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self.entries: "OrderedDict[Hashable, Tuple[float, str]]" = OrderedDict()
+        self.vectors: Dict[Hashable, Tuple[str, np.ndarray]] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    @staticmethod
+    def make_key(model: str, prompt: str, params: Optional[Dict] = None) -> str:
+        return hashlib.sha256(json.dumps([model, prompt, params or {}], sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def semantic_scope(model: str, prompt: str, params: Optional[Dict], semantic_key: str) -> str:
+        return LLMResponseCache.make_key(model, prompt.replace(semantic_key, "\0"), params)
+
+    def get(self, model: str, prompt: str, params: Optional[Dict] = None, semantic_key: Optional[str] = None) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = self.make_key(model, prompt, params)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] >= now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+            use_semantic = self.semantic_threshold is not None and semantic_key and self.vectors
+
+        if use_semantic:
+            scope = self.semantic_scope(model, prompt, params, semantic_key)
+            query = self._embed(semantic_key)
+            with self.lock:
+                candidates = [(k, vector) for k, (s, vector) in self.vectors.items()
+                              if s == scope and self.entries[k][0] >= now]
+                if candidates:
+                    similarities = np.stack([vector for _, vector in candidates]) @ query
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.semantic_threshold:
+                        match = candidates[best][0]
+                        self.entries.move_to_end(match)
+                        self.semantic_hits += 1
+                        return self.entries[match][1]
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, model: str, prompt: str, response: str, params: Optional[Dict] = None, semantic_key: Optional[str] = None):
+        if not response or not self.enabled:
+            return
+        key = self.make_key(model, prompt, params)
+        vector = None
+        if self.semantic_threshold is not None and semantic_key:
+            vector = (self.semantic_scope(model, prompt, params, semantic_key), self._embed(semantic_key))
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, response)
+            self.entries.move_to_end(key)
+            if vector is not None:
+                self.vectors[key] = vector
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        self.entries.pop(key, None)
+        self.vectors.pop(key, None)
+
+    @staticmethod
+    def _embed(text: str) -> np.ndarray:
+        vector = np.asarray(encode_text(text), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.vectors.clear()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "semantic_threshold": self.semantic_threshold,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0
+            }
+
+_semantic_threshold = os.getenv("LLM_CACHE_SEMANTIC_THRESHOLD", "")
+llm_cache = LLMResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL", "3600")),
+    semantic_threshold=float(_semantic_threshold) if _semantic_threshold else None
+)
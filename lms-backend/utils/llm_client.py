@@ -0,0 +1,132 @@
+from typing import AsyncIterator, Dict, Optional, Tuple
+import json
+import os
+import threading
+import httpx
+from openai import OpenAI
+from .llm_cache import llm_cache
+
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+OPENROUTER_CHAT_URL = f"{OPENROUTER_BASE_URL}/chat/completions"
+TOGETHER_COMPLETIONS_URL = os.getenv("TOGETHER_COMPLETIONS_URL", "https://api.together.xyz/v1/completions")
+
+# Generation can take a while; connecting should not
+LLM_TIMEOUT = httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "120")), connect=float(os.getenv("LLM_CONNECT_TIMEOUT", "10")))
+LLM_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "32")),
+    max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "16")),
+    keepalive_expiry=60
+)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_openrouter_clients: Dict[str, OpenAI] = {}
+
+def get_http_client() -> httpx.Client:
+    """Process-wide keep-alive client shared by every synchronous LLM call"""
+    global _http_client
+    if _http_client is None:
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.Client(timeout=LLM_TIMEOUT, limits=LLM_LIMITS)
+    return _http_client
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Keep-alive client for async LLM calls (used from the server's event loop)"""
+    global _async_http_client
+    if _async_http_client is None:
+        with _lock:
+            if _async_http_client is None:
+                _async_http_client = httpx.AsyncClient(timeout=LLM_TIMEOUT, limits=LLM_LIMITS)
+    return _async_http_client
+
+def get_openrouter_client(api_key: str) -> OpenAI:
+    """OpenAI SDK client for OpenRouter on top of the shared connection pool, one per API key"""
+    http_client = get_http_client()
+    with _lock:
+        client = _openrouter_clients.get(api_key)
+        if client is None:
+            client = _openrouter_clients[api_key] = OpenAI(
+                base_url=OPENROUTER_BASE_URL, api_key=api_key, max_retries=LLM_MAX_RETRIES,
+                timeout=LLM_TIMEOUT, http_client=http_client
+            )
+    return client
+
+def together_completion(prompt: str, api_key: str, model_name: str, max_tokens: int = 500, temperature: float = 0.8) -> httpx.Response:
+    """POST a completion request to Together over the shared pool; returns the raw response"""
+    return get_http_client().post(
+        TOGETHER_COMPLETIONS_URL,
+        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        json={"model": model_name, "prompt": prompt, "temperature": temperature, "max_tokens": max_tokens}
+    )
+
+def _chat_request(prompt: str, model: str, api_key: str, params: Dict) -> Tuple[Dict, Dict]:
+    """Headers and payload of an OpenAI-style chat request with a single user message"""
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    payload = {"model": model, "messages": [{"role": "user", "content": prompt}], **params}
+    return headers, payload
+
+async def chat_completion(prompt: str, model: str, api_key: str, url: Optional[str] = None,
+                          cache: bool = True, **params) -> str:
+    """
+    Awaitable chat completion on the shared async pool, so the event loop isn't blocked for the
+    whole generation. Repeated (model, prompt, params) calls are answered from llm_cache.
+    url defaults to OpenRouter's chat endpoint; extra params (temperature, ...) go in the payload.
+    """
+    if cache:
+        cached = llm_cache.get(model, prompt, params or None)
+        if cached is not None:
+            return cached
+    headers, payload = _chat_request(prompt, model, api_key, params)
+    response = await get_async_http_client().post(url or OPENROUTER_CHAT_URL, headers=headers, json=payload)
+    if response.status_code != 200:
+        raise Exception(f"API Error: {response.status_code} - {response.text}")
+    data = response.json()
+    if not data.get("choices"):
+        raise Exception(f"Unexpected response structure: {data}")
+    content = data["choices"][0]["message"]["content"]
+    if cache:
+        llm_cache.put(model, prompt, content, params or None)
+    return content
+
+async def astream_chat_completion(prompt: str, model: str, api_key: str, url: Optional[str] = None,
+                                  **params) -> AsyncIterator[str]:
+    """Streaming chat_completion (no caching): yields content deltas as they arrive"""
+    headers, payload = _chat_request(prompt, model, api_key, {**params, "stream": True})
+    async with get_async_http_client().stream("POST", url or OPENROUTER_CHAT_URL, headers=headers, json=payload) as response:
+        if response.status_code != 200:
+            body = await response.aread()
+            raise Exception(f"API Error: {response.status_code} - {body.decode(errors='replace')}")
+        async for line in response.aiter_lines():
+            # Skips blank separators and keep-alive comments such as ": OPENROUTER PROCESSING"
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if "error" in chunk:
+                raise Exception(f"API Error: {chunk['error']}")
+            for choice in chunk.get("choices", []):
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    yield text
+
+def close_llm_clients():
+    """Close pooled connections (synchronous side); the async pool is closed by aclose_llm_clients"""
+    global _http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+        _openrouter_clients.clear()
+
+async def aclose_llm_clients():
+    """Close both pools, e.g. on application shutdown"""
+    global _async_http_client
+    close_llm_clients()
+    if _async_http_client is not None:
+        client, _async_http_client = _async_http_client, None
+        await client.aclose()
@@ -0,0 +1,70 @@
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+import pypdf
+from langchain_core.documents import Document
+
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+
+# Pools are kept alive between files so worker start-up is paid once per process
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        if workers not in _pools:
+            # Not fork: the pool is started from an ingestion thread of a multi-threaded server
+            # (torch included), and forking such a process can deadlock the children
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _pools[workers]
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str, str]]:
+    """Worker: extract (page number, page label, text) for pages [start, end) of a PDF"""
+    reader = pypdf.PdfReader(file_path)
+    pages = []
+    for page_number in range(start, end):
+        try:
+            label = reader.page_labels[page_number]
+        except Exception:
+            label = str(page_number + 1)
+        pages.append((page_number, label, reader.pages[page_number].extract_text() or ""))
+    return pages
+
+def count_pdf_pages(file_path: str) -> int:
+    return len(pypdf.PdfReader(file_path).pages)
+
+def load_pdf_parallel(file_path: str, workers: Optional[int] = None, total_pages: Optional[int] = None) -> List[Document]:
+    """
+    Extract a PDF's pages in a process pool and return one Document per page, in page order.
+    Metadata matches PyPDFLoader's (source, page, page_label, total_pages).
+    """
+    workers = workers or PDF_PARSE_WORKERS
+    total_pages = total_pages if total_pages is not None else count_pdf_pages(file_path)
+    if total_pages == 0:
+        return []
+
+    # A few ranges per worker so one slow (e.g. scanned) range doesn't leave the others idle
+    range_size = max(1, -(-total_pages // (workers * 4)))
+    ranges = [(start, min(start + range_size, total_pages)) for start in range(0, total_pages, range_size)]
+
+    pool = _get_pool(workers)
+    futures = [pool.submit(_extract_page_range, file_path, start, end) for start, end in ranges]
+
+    documents = []
+    for future in futures:
+        for page_number, label, text in future.result():
+            documents.append(Document(
+                page_content=text,
+                metadata={
+                    'source': file_path,
+                    'page': page_number,
+                    'page_label': label,
+                    'total_pages': total_pages
+                }
+            ))
+    return documents
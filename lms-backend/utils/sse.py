@@ -0,0 +1,33 @@
+from typing import Any, AsyncIterator, Iterator, Tuple, Union
+import json
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+
+def format_sse(event: str, data: Any) -> str:
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def sse_response(events: Union[AsyncIterator[Tuple[str, Any]], Iterator[Tuple[str, Any]]]) -> StreamingResponse:
+    """
+    Stream (event, data) pairs as text/event-stream. Plain iterators (e.g. a LangGraph
+    graph.stream loop) are advanced in the threadpool so they never block the event loop.
+    An exception ends the stream with an `error` event instead of a broken connection.
+    """
+    if not hasattr(events, "__aiter__"):
+        events = iterate_in_threadpool(events)
+
+    async def body():
+        # A comment goes out immediately so clients and proxies see the first byte right away
+        yield ": connected\n\n"
+        try:
+            async for event, data in events:
+                yield format_sse(event, data)
+        except Exception as e:
+            print("stream failed:", e)
+            yield format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,11 +1,14 @@
 # lms-backend/utils/storage_manager.py
-from typing import List, Dict, BinaryIO, Optional
+from typing import List, Dict, BinaryIO, Optional, Callable, Iterator, Tuple
 from supabase import create_client
 import os
 from pathlib import Path
 import json
-from sentence_transformers import SentenceTransformer
-# import numpy as np
+import hashlib
+import time
+import uuid
+import httpx
+import numpy as np
 from langchain_community.document_loaders import (
     PyPDFLoader,
     TextLoader,
@@ -14,23 +17,436 @@ from langchain_community.document_loaders import (
     NotebookLoader
 )
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-import requests
-import tempfile
 from urllib.parse import urlparse
+from database.document_id_cache import document_ids
+from database.search_cache import search_cache
+from database.vector_index import vector_indexes, parse_embedding
+from .downloads import download_to_tempfile
+from .pdf_parsing import load_pdf_parallel, count_pdf_pages, PDF_PARSE_WORKERS, PDF_PARALLEL_MIN_PAGES
+from .embedding_models import get_embedding_model, encode_text, encode_texts
+
+def content_hash(data) -> str:
+    """SHA-256 hex digest of a chunk's text or a file's bytes"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+def file_hash(file_path: str) -> str:
+    """SHA-256 hex digest of a local file, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def encode_vector(embedding) -> str:
+    """
+    Compact pgvector text literal for the wire, e.g. '[0.0123457,-0.5,...]'.
+    Six significant digits keeps cosine rankings intact and roughly halves the
+    request body compared with a JSON list of full-precision floats.
+    """
+    return '[' + ','.join(map('{:.6g}'.format, np.asarray(embedding, dtype=np.float32).tolist())) + ']'
+
+def pool_embeddings(embeddings: np.ndarray, texts: List[str], mode: str = 'mean') -> np.ndarray:
+    """
+    Document vector from its chunk vectors: the mean of the L2-normalized chunks, or with
+    mode='length' weighted by chunk length so short fragments count for less. Unit length.
+    """
+    if len(embeddings) == 0:
+        return np.zeros(embeddings.shape[1], dtype=np.float32)
+    unit = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    if mode == 'length':
+        weights = np.array([len(text) for text in texts], dtype=np.float32)
+        pooled = weights @ unit / max(weights.sum(), 1e-12)
+    else:
+        pooled = unit.mean(axis=0)
+    return (pooled / max(np.linalg.norm(pooled), 1e-12)).astype(np.float32)
+
+def embedding_centroids(embeddings: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """k spherical k-means centroids of the chunk vectors, ordered by cluster size"""
+    unit = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    k = min(k, len(unit))
+    rng = np.random.default_rng(seed)
+    centroids = unit[rng.choice(len(unit), size=k, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(unit @ centroids.T, axis=1)
+        updated = np.stack([
+            unit[assignment == c].sum(axis=0) if np.any(assignment == c) else centroids[c]
+            for c in range(k)
+        ])
+        updated /= np.maximum(np.linalg.norm(updated, axis=1, keepdims=True), 1e-12)
+        if np.allclose(updated, centroids):
+            break
+        centroids = updated
+    sizes = np.bincount(np.argmax(unit @ centroids.T, axis=1), minlength=k)
+    return centroids[np.argsort(-sizes)].astype(np.float32)
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Whether a failed PostgREST call is worth retrying: timeouts and connection errors, 5xx
+    responses, and Postgres connection/resource/serialization errors. Constraint and other
+    4xx-class errors are not, since the same request would fail again.
+    """
+    if isinstance(error, httpx.TransportError):
+        return True
+    code = str(getattr(error, 'code', '') or '')
+    return code.startswith('5') or code[:2] in ('08', '40')
 
 class StorageManager:
-    def __init__(self, supabase_url: str, supabase_key: str):
+    def __init__(self, supabase_url: str, supabase_key: str, embedding_batch_size: Optional[int] = None, pdf_parse_workers: Optional[int] = None):
         self.supabase = create_client(supabase_url, supabase_key)
-        self.embedding_model = SentenceTransformer('thenlper/gte-base')
+        self.embedding_batch_size = embedding_batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+        self.insert_batch_size = int(os.getenv("CHUNK_INSERT_BATCH_SIZE", "100"))
+        self.insert_max_bytes = int(os.getenv("CHUNK_INSERT_MAX_BYTES", str(2 << 20)))
+        self.insert_max_attempts = int(os.getenv("CHUNK_INSERT_MAX_ATTEMPTS", "4"))
+        self.insert_backoff = 0.5
+        # Document vectors are pooled from chunk vectors; 'mean' or 'length' weighted
+        self.doc_pooling = os.getenv("DOC_EMBEDDING_POOLING", "mean")
+        # Number of centroid vectors kept in metadata for long documents (0 disables)
+        self.doc_centroids = int(os.getenv("DOC_EMBEDDING_CENTROIDS", "0"))
+        # Large PDFs are parsed page-parallel when more than one worker is configured
+        self.pdf_parse_workers = pdf_parse_workers or PDF_PARSE_WORKERS
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200
         )
 
+    @property
+    def embedding_model(self):
+        """Shared GTE-base model, loaded on first use"""
+        return get_embedding_model()
+
     def get_embedding(self, text: str) -> List[float]:
         """Generate embedding using GTE-base model"""
-        embedding = self.embedding_model.encode(text)
-        return embedding.tolist()
+        return encode_text(text).tolist()
+
+    def get_embeddings(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        Generate embeddings for many texts in length-sorted mini-batches.
+        Returns a contiguous (len(texts), dim) float32 array in the original order of `texts`.
+        """
+        return encode_texts(texts, batch_size=batch_size or self.embedding_batch_size)
+
+    def get_stored_embeddings(self, document_id: int, hashes: List[str], lookup_batch_size: int = 100) -> Dict[str, np.ndarray]:
+        """
+        Look up embeddings of a stored document's chunks by content hash.
+        Scoped to one document (the file being re-uploaded) so the lookup only reads that
+        document's rows; content shared across files is still served by the embedding cache.
+        """
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique_hashes), lookup_batch_size):
+            batch = unique_hashes[start:start + lookup_batch_size]
+            try:
+                response = self.supabase.table('chunks_embed')\
+                    .select('embedding, content_hash:metadata->>content_hash')\
+                    .eq('embedding_id', document_id)\
+                    .in_('metadata->>content_hash', batch)\
+                    .execute()
+            except Exception as e:
+                # Reuse is an optimization: whatever wasn't found is encoded instead
+                print(f"chunk hash lookup for document {document_id} failed, re-encoding remaining chunks: {e}")
+                break
+            for row in response.data or []:
+                if row.get('content_hash') and row['content_hash'] not in found:
+                    found[row['content_hash']] = parse_embedding(row['embedding'])
+        return found
+
+    def embed_chunks(self, texts: List[str], document_id: Optional[int] = None) -> Tuple[np.ndarray, List[str], int]:
+        """
+        Embed chunk texts, reusing the stored embeddings of document_id (the previous version
+        of the same file) for content that hasn't changed.
+        Returns (embeddings, content hashes, number of chunks that needed the model).
+        """
+        hashes = [content_hash(text) for text in texts]
+        known = self.get_stored_embeddings(document_id, hashes) if document_id is not None else {}
+
+        # Encode each unseen text once, even if it repeats within the document
+        missing = {}
+        for text, h in zip(texts, hashes):
+            if h not in known and h not in missing:
+                missing[h] = text
+        if missing:
+            new_embeddings = self.get_embeddings(list(missing.values()))
+            known.update(zip(missing.keys(), new_embeddings))
+
+        dim = self.embedding_model.get_sentence_embedding_dimension()
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+        for i, h in enumerate(hashes):
+            embeddings[i] = known[h]
+        print(f"reused {len(texts) - len(missing)} of {len(texts)} chunk embeddings")
+        return embeddings, hashes, len(missing)
+
+    def _insert_with_retry(self, table: str, rows: List[Dict], before_retry: Optional[Callable[[], None]] = None,
+                           on_conflict: Optional[str] = None):
+        """
+        Insert rows (or upsert them on on_conflict), retrying transient failures with exponential backoff.
+        An insert attempt that timed out may still have committed, so before_retry must remove
+        whatever it could have written; otherwise a retry would store the rows twice.
+        """
+        for attempt in range(self.insert_max_attempts):
+            try:
+                if attempt and before_retry:
+                    before_retry()
+                if on_conflict:
+                    return self.supabase.table(table).upsert(rows, on_conflict=on_conflict).execute()
+                return self.supabase.table(table).insert(rows).execute()
+            except Exception as e:
+                if attempt == self.insert_max_attempts - 1 or not is_transient_error(e):
+                    raise
+                delay = self.insert_backoff * (2 ** attempt)
+                print(f"insert into {table} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _chunk_batches(self, chunk_data: List[Dict]) -> Iterator[List[Dict]]:
+        """Split chunk rows into batches bounded by row count and approximate body size"""
+        batch, batch_bytes = [], 0
+        for row in chunk_data:
+            row_bytes = len(row['content'].encode('utf-8')) + len(row['embedding']) + 200
+            if batch and (len(batch) >= self.insert_batch_size or batch_bytes + row_bytes > self.insert_max_bytes):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(row)
+            batch_bytes += row_bytes
+        if batch:
+            yield batch
+
+    def insert_chunks(self, chunk_data: List[Dict], progress: Optional[Callable[[int], None]] = None) -> List[int]:
+        """
+        Insert chunk rows in batches bounded by row count and approximate body size.
+        Returns the ids of the inserted rows in order; raises if any batch still fails after retries.
+        """
+        inserted_ids: List[int] = []
+        for batch in self._chunk_batches(chunk_data):
+            inserted_ids.extend(self._insert_chunk_batch(batch))
+            if progress:
+                progress(len(inserted_ids))
+        return inserted_ids
+
+    def upsert_chunks(self, chunk_data: List[Dict], progress: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Rewrite existing chunk rows (each with its id) in the same bounded batches as insert_chunks.
+        Upserting on id is idempotent, so batches are retried without cleanup. Returns rows written.
+        """
+        written = 0
+        for batch in self._chunk_batches(chunk_data):
+            self._insert_with_retry('chunks_embed', batch, on_conflict='id')
+            written += len(batch)
+            if progress:
+                progress(written)
+        return written
+
+    def _insert_chunk_batch(self, batch: List[Dict]) -> List[int]:
+        def clear_batch():
+            # Rows of this batch are identified by (embedding_id, chunk_index)
+            self.supabase.table('chunks_embed').delete()\
+                .eq('embedding_id', batch[0]['embedding_id'])\
+                .in_('chunk_index', [row['chunk_index'] for row in batch])\
+                .execute()
+        response = self._insert_with_retry('chunks_embed', batch, before_retry=clear_batch)
+        if not response.data or len(response.data) != len(batch):
+            raise Exception(f"Stored {len(response.data or [])} of {len(batch)} chunk rows")
+        return [row['id'] for row in response.data]
+
+    def delete_document(self, document_id: int):
+        """Remove a document and its chunks (used to roll back a failed ingest)"""
+        try:
+            self.supabase.table('chunks_embed').delete().eq('embedding_id', document_id).execute()
+            self.supabase.table('document_embed').delete().eq('id', document_id).execute()
+            print("rolled back document", document_id)
+        except Exception as e:
+            print("got-exception-rolling-back-document", document_id, e)
+
+    def find_document(self, course_id: int, originalFilePath: str) -> Optional[Dict]:
+        """Return the most recent stored document row for this course and file path, if any"""
+        try:
+            response = self.supabase.table('document_embed')\
+                .select('id, course_id, title, total_chunks, metadata')\
+                .eq('course_id', course_id)\
+                .eq('file_path', originalFilePath)\
+                .order('id', desc=True)\
+                .limit(1)\
+                .execute()
+        except Exception as e:
+            print("got-exception-looking-up-document", e)
+            return None
+        return response.data[0] if response.data else None
+
+    def get_document_chunks(self, document_id: int, page_size: int = 1000) -> List[Dict]:
+        """Fetch (id, chunk_index, content_hash, metadata) for every stored chunk of a document"""
+        rows = []
+        last_index = -1
+        while True:
+            response = self.supabase.table('chunks_embed')\
+                .select('id, chunk_index, metadata, content_hash:metadata->>content_hash')\
+                .eq('embedding_id', document_id)\
+                .gt('chunk_index', last_index)\
+                .order('chunk_index')\
+                .limit(page_size)\
+                .execute()
+            rows.extend(response.data)
+            if len(response.data) < page_size:
+                break
+            last_index = response.data[-1]['chunk_index']
+
+        # Chunks stored before content hashes existed need their text to be hashed here
+        unhashed = [row['id'] for row in rows if not row.get('content_hash')]
+        for start in range(0, len(unhashed), 100):
+            response = self.supabase.table('chunks_embed')\
+                .select('id, content')\
+                .in_('id', unhashed[start:start + 100])\
+                .execute()
+            hashes = {row['id']: content_hash(row['content']) for row in response.data}
+            for row in rows:
+                if row['id'] in hashes:
+                    row['content_hash'] = hashes[row['id']]
+        return rows
+
+    def get_chunk_rows(self, chunk_ids: List[int]) -> List[Dict]:
+        """Full stored rows (id, embedding_id, content, embedding, chunk_index, metadata) for chunk_ids"""
+        rows = []
+        for start in range(0, len(chunk_ids), 100):
+            response = self.supabase.table('chunks_embed')\
+                .select('id, embedding_id, content, embedding, chunk_index, metadata')\
+                .in_('id', chunk_ids[start:start + 100])\
+                .execute()
+            rows.extend(response.data)
+        return rows
+
+    def restore_chunks(self, document_id: int, snapshot: List[Dict], max_id: int):
+        """
+        Undo a partial re-ingest: drop chunks inserted after max_id (ids only grow) and upsert the
+        snapshot rows back, which also re-creates deleted ones under their original ids.
+        """
+        try:
+            self.supabase.table('chunks_embed').delete().eq('embedding_id', document_id).gt('id', max_id).execute()
+            self.upsert_chunks(snapshot)
+            print("restored chunks of document", document_id)
+        except Exception as e:
+            print("got-exception-restoring-document", document_id, e)
+        search_cache.invalidate_documents([document_id])
+
+    def reingest_document(self,
+                          document: Dict,
+                          splits: List,
+                          chunk_embeddings: np.ndarray,
+                          encoded: int,
+                          doc_embedding: np.ndarray,
+                          metadata: Dict,
+                          folder: Optional[str],
+                          progress: Callable[[str, int], None]
+                          ) -> Dict:
+        """
+        Bring a stored document's chunks in line with a new split list.
+        Stored chunks are matched to new splits by content hash: matches are kept (and only
+        renumbered if their position moved), unmatched stored rows are overwritten with new
+        content, and whatever is left over is inserted or deleted. Only new content was embedded
+        (embed_chunks reuses stored vectors), and only changed rows are written, in batched upserts.
+        The rows it touches are snapshotted first; if any write fails they are restored (see
+        restore_chunks) and the error is raised, so a re-upload still succeeds or fails as a whole.
+        total_chunks is kept on document_embed only (chunk rows don't carry it), so a changed
+        count doesn't touch every chunk.
+        """
+        document_id = document['id']
+        course_id = document['course_id']
+        texts = [split.page_content for split in splits]
+        new_hashes = [content_hash(text) for text in texts]
+        total_chunks = len(splits)
+
+        stored_by_hash: Dict[str, List[Dict]] = {}
+        for row in self.get_document_chunks(document_id):
+            stored_by_hash.setdefault(row['content_hash'], []).append(row)
+
+        renumber = []      # (stored row, new index) for unchanged content
+        changed = []       # new indexes whose content isn't stored yet
+        for i, h in enumerate(new_hashes):
+            if stored_by_hash.get(h):
+                renumber.append((stored_by_hash[h].pop(0), i))
+            else:
+                changed.append(i)
+        leftover = [row for rows in stored_by_hash.values() for row in rows]
+        overwrite = list(zip(leftover, changed))
+        to_insert = changed[len(overwrite):]
+        to_delete = [row['id'] for row in leftover[len(overwrite):]]
+
+        print(f"re-ingesting document {document_id}: {len(changed)} changed chunks "
+              f"({encoded} encoded), {len(to_delete)} removed, {total_chunks - len(changed)} unchanged")
+
+        def chunk_row(chunk_id: int, i: int, metadata: Dict) -> Dict:
+            # Full rows, so the upsert's insert half satisfies the table's NOT NULL columns
+            return {
+                'id': chunk_id,
+                'embedding_id': document_id,
+                'content': texts[i],
+                'embedding': encode_vector(chunk_embeddings[i]),
+                'chunk_index': i,
+                'metadata': {
+                    **{k: v for k, v in metadata.items() if k != 'total_chunks'},
+                    'chunk_index': i,
+                    'content_hash': new_hashes[i]
+                }
+            }
+
+        # Kept rows are rewritten only if their position moved
+        moved = [(row, i) for row, i in renumber if row['chunk_index'] != i]
+        rewrites = [chunk_row(row['id'], i, row.get('metadata') or {}) for row, i in moved]
+        rewrites += [chunk_row(row['id'], i, {}) for row, i in overwrite]
+
+        # Everything this re-ingest can touch, as it is now, so a failure can put it back
+        snapshot = [{
+            'id': row['id'],
+            'embedding_id': document_id,
+            'content': texts[i],
+            'embedding': encode_vector(chunk_embeddings[i]),
+            'chunk_index': row['chunk_index'],
+            'metadata': row.get('metadata') or {}
+        } for row, i in moved] + self.get_chunk_rows([row['id'] for row in leftover])
+        max_id = max([row['id'] for row, _ in renumber] + [row['id'] for row in leftover], default=0)
+
+        try:
+            rows_written = self.upsert_chunks(rewrites, progress=lambda written: progress('rows_written', written))
+            for start in range(0, len(to_delete), 100):
+                self.supabase.table('chunks_embed').delete().in_('id', to_delete[start:start + 100]).execute()
+
+            inserted_ids = []
+            if to_insert:
+                inserted_ids = self.insert_chunks([{
+                    'embedding_id': document_id,
+                    'content': texts[i],
+                    'embedding': encode_vector(chunk_embeddings[i]),
+                    'chunk_index': i,
+                    'metadata': {'chunk_index': i, 'content_hash': new_hashes[i]}
+                } for i in to_insert], progress=lambda written: progress('rows_written', rows_written + written))
+                rows_written += len(inserted_ids)
+
+            self.supabase.table('document_embed').update({
+                'total_chunks': total_chunks,
+                'embedding': encode_vector(doc_embedding),
+                'metadata': metadata
+            }).eq('id', document_id).execute()
+        except Exception as e:
+            print("got-exception-reingesting-document", document_id, e)
+            self.restore_chunks(document_id, snapshot, max_id)
+            raise Exception(f"Failed to re-ingest document {document_id}: {e}")
+        progress('rows_written', rows_written + 1)
+
+        # The local index holds content and vectors, not positions: only new content needs applying
+        overwritten_ids = [row['id'] for row, _ in overwrite]
+        vector_indexes.remove_chunks(course_id, overwritten_ids + to_delete)
+        added = [i for _, i in overwrite] + to_insert
+        if added:
+            vector_indexes.add_chunks(course_id, document_id, overwritten_ids + inserted_ids,
+                                      [texts[i] for i in added], chunk_embeddings[added])
+        search_cache.invalidate_documents([document_id])
+
+        return {
+            "embedding_id": document_id,
+            "total_chunks": total_chunks,
+            "file_name": document['title'],
+            "folder": folder,
+            "chunks_changed": len(changed),
+            "chunks_removed": len(to_delete)
+        }
 
     def load_file(self, file_path: str):
         """Load different file types from local path or Supabase URL"""
@@ -48,33 +464,33 @@ class StorageManager:
 
         # Check if file_path is a URL
         if file_path.startswith('http'):
-            # Download the file content
-            response = requests.get(file_path)
-            response.raise_for_status()  # Raise exception for bad status codes
-
-            # Create a temporary file to pass to the loader
-            with tempfile.NamedTemporaryFile(suffix=file_extension, delete=False) as temp_file:
-                temp_file.write(response.content)
-                temp_file_path = temp_file.name
+            # Stream the file to a temporary file to pass to the loader
+            temp_file_path = download_to_tempfile(file_path, suffix=file_extension)
 
             try:
-                loader = loaders[file_extension](temp_file_path)
-                documents = loader.load()
+                documents = self._load_documents(loaders[file_extension], temp_file_path, file_extension)
             finally:
                 # Clean up the temporary file
                 os.unlink(temp_file_path)
         else:
             # Handle local file path
-            loader = loaders[file_extension](file_path)
-            # print("got loader",loader)
             try:
-                documents = loader.load()
+                documents = self._load_documents(loaders[file_extension], file_path, file_extension)
             except Exception as e:
                 print("err",e)
             # print("loaded using loader")
 
         return documents
 
+    def _load_documents(self, loader_cls, file_path: str, file_extension: str):
+        """Run the loader for a local file, splitting long PDFs into page ranges across a process pool"""
+        if file_extension == '.pdf' and self.pdf_parse_workers > 1:
+            total_pages = count_pdf_pages(file_path)
+            if total_pages >= PDF_PARALLEL_MIN_PAGES:
+                print(f"parsing {total_pages} pdf pages with {self.pdf_parse_workers} workers")
+                return load_pdf_parallel(file_path, workers=self.pdf_parse_workers, total_pages=total_pages)
+        return loader_cls(file_path).load()
+
     def _get_url_extension(self, url: str) -> str:
         """Extract file extension from a URL"""
         path = urlparse(url).path
@@ -85,18 +501,44 @@ class StorageManager:
                     course_id: int,
                     originalFilePath: str,
                     folder: Optional[str] = None,
+                    progress: Optional[Callable[[str, int], None]] = None,
+                    incremental: bool = True
                     ) -> Dict:
-        """Process a file and store its embeddings"""
+        """
+        Process a file and store its embeddings.
+        If the course already has a document at originalFilePath and `incremental` is set,
+        only the chunks that changed are written (see reingest_document).
+        `progress(key, value)` is called with pages_parsed, chunks_embedded and rows_written as ingestion advances.
+        """
+        progress = progress or (lambda key, value: None)
+
+        # 0. Skip files whose exact bytes were already ingested at this path
+        digest = file_hash(file_path) if not file_path.startswith('http') else None
+        existing = self.find_document(course_id, originalFilePath)
+        if existing and digest and (existing.get('metadata') or {}).get('file_hash') == digest:
+            print("file unchanged since last ingest, reusing document", existing['id'])
+            return {
+                "embedding_id": existing['id'],
+                "total_chunks": existing['total_chunks'],
+                "file_name": existing['title'],
+                "folder": folder,
+                "unchanged": True
+            }
 
         # 1. Load and split the document
         documents = self.load_file(file_path)
+        progress('pages_parsed', len(documents))
         # print("loaded file", documents)
         splits = self.text_splitter.split_documents(documents)
         # print("split file", splits)
 
-        # 2. Generate document-level embedding
-        doc_content = " ".join([split.page_content for split in splits])
-        doc_embedding = self.get_embedding(doc_content)
+        # 2. Embed chunks before writing anything, so an encoder failure leaves no rows behind
+        texts = [split.page_content for split in splits]
+        chunk_embeddings, chunk_hashes, encoded = self.embed_chunks(texts, existing['id'] if existing else None)
+        progress('chunks_embedded', len(splits))
+
+        # 3. Derive the document-level embedding from the chunk vectors (no extra model pass)
+        doc_embedding = pool_embeddings(chunk_embeddings, texts, mode=self.doc_pooling)
 
         # Prepare metadata
         if file_path.startswith('http'):
@@ -108,59 +550,74 @@ class StorageManager:
             'total_chunks': len(splits),
             'folder': folder
         }
+        if self.doc_centroids and len(splits) >= 4 * self.doc_centroids:
+            # Long files also keep a few topic centroids so one averaged vector doesn't blur them together
+            metadata['centroids'] = [
+                encode_vector(centroid) for centroid in embedding_centroids(chunk_embeddings, self.doc_centroids)
+            ]
 
-        # 3. Store document metadata and embedding
-        # print("got metadata")
-        try:
-            doc_response = self.supabase.table('document_embed').insert({
-                'course_id': course_id,
-                'title': file_name,
-                'file_path': originalFilePath,
-                'content_type': folder or 'default',
-                'total_chunks': len(splits),
-                'embedding': doc_embedding,
-                'metadata': metadata
-            }).execute()
-        except Exception as e:
-            print("got-exception-uploading-embedding2db",e)
-        # print("doc resp", doc_response)
+        if existing and incremental:
+            # reingest_document writes the metadata in its final update, after every chunk change
+            metadata['file_hash'] = digest
+            return self.reingest_document(existing, splits, chunk_embeddings, encoded, doc_embedding, metadata, folder, progress)
 
+        # 4. Store document metadata and embedding; ingest_id finds the row again if an attempt timed out
+        metadata['ingest_id'] = uuid.uuid4().hex
+        def clear_document():
+            self.supabase.table('document_embed').delete()\
+                .eq('course_id', course_id)\
+                .eq('file_path', originalFilePath)\
+                .eq('metadata->>ingest_id', metadata['ingest_id'])\
+                .execute()
+        doc_response = self._insert_with_retry('document_embed', [{
+            'course_id': course_id,
+            'title': file_name,
+            'file_path': originalFilePath,
+            'content_type': folder or 'default',
+            'total_chunks': len(splits),
+            'embedding': encode_vector(doc_embedding),
+            'metadata': metadata
+        }], before_retry=clear_document)
         if not doc_response.data:
             raise Exception("Failed to store document embedding")
 
         document_id = doc_response.data[0]['id']
+        document_ids.invalidate_paths([originalFilePath])
         print("doc id", document_id, "num splits", len(splits))
+        progress('rows_written', 1)
 
-        # 4. Process and store chunks
+        # 5. Store chunks in bounded batches; a failure removes the document and any chunks already written
         chunk_data = []
         for i, split in enumerate(splits):
-            chunk_embedding = self.get_embedding(split.page_content)
-            # print("got chunk embedding", i)
-
             chunk_data.append({
                 'embedding_id': document_id,
                 'content': split.page_content,
-                'embedding': chunk_embedding,
+                'embedding': encode_vector(chunk_embeddings[i]),
                 'chunk_index': i,
                 'metadata': {
                     'chunk_index': i,
-                    'total_chunks': len(splits)
+                    'content_hash': chunk_hashes[i]
                 },
-                # "content_tsv": f"to_tsvector('english', '{split.page_content.replace("'", "''")}')"
                 # "content_tsv": out_tsv  ###auto generated
             })
-
-        # Batch insert chunks
-        # print("chunk data",chunk_data[0])
         try:
-            chunk_response = self.supabase.table('chunks_embed').insert(chunk_data).execute()
+            chunk_ids = self.insert_chunks(chunk_data, progress=lambda written: progress('rows_written', 1 + written))
         except Exception as e:
-            print("got-exception-uploading-chunks2db",e)
-
-        # print("chunk resp", chunk_response)
+            print("got-exception-uploading-chunks2db", e)
+            self.delete_document(document_id)
+            document_ids.invalidate_paths([originalFilePath])
+            raise Exception(f"Failed to store chunk embeddings: {e}")
 
-        if not chunk_response.data:
-            raise Exception("Failed to store chunk embeddings")
+        # 6. Only a document whose chunks are all stored carries the file hash that lets re-uploads skip it;
+        # a process killed before this point leaves a row that the next upload re-ingests
+        if digest:
+            metadata['file_hash'] = digest
+            try:
+                self.supabase.table('document_embed').update({'metadata': metadata}).eq('id', document_id).execute()
+            except Exception as e:
+                print("got-exception-storing-file-hash", document_id, e)
+        vector_indexes.add_chunks(course_id, document_id, chunk_ids, texts, chunk_embeddings)
+        search_cache.invalidate_documents([document_id])
 
         return {
             "embedding_id": document_id,